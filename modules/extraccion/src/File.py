@@ -1,17 +1,80 @@
 import collections
 import os
 import glob
-import time
 import yaml
 import pandas as pd
 import polars as pl
+import pyarrow as pa
 import sqlite3
 import gc
-import psutil
+import hashlib
+import json
 import sys
+import threading
+import time
+
+from modules.extraccion.src.sqlite_pool import SQLitePool
+from modules.extraccion.src.cache_lock import CacheBuildLock
+from modules.extraccion.src.cancellation import CancellationToken
+from modules.extraccion.src.profiling import Profiler
 
 MODULE_BASE = os.path.dirname(os.path.dirname(__file__))
 
+FINGERPRINT_BLOCK = 256 * 1024  # Bytes leídos por cada bloque muestreado
+FINGERPRINT_SAMPLES = 16  # Bloques intermedios además de cabeza y cola
+
+
+def file_fingerprint(path):
+    """
+    Huella rápida del fichero fuente: ruta, tamaño, mtime y un hash de la cabeza, la cola
+    y FINGERPRINT_SAMPLES bloques repartidos. Los ficheros pequeños se hashean enteros.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        if size <= FINGERPRINT_BLOCK * (FINGERPRINT_SAMPLES + 2):
+            digest.update(f.read())
+        else:
+            step = size // (FINGERPRINT_SAMPLES + 1)
+            offsets = [0] + [step * i for i in range(1, FINGERPRINT_SAMPLES + 1)] + [size - FINGERPRINT_BLOCK]
+            for offset in offsets:
+                f.seek(offset)
+                digest.update(f.read(FINGERPRINT_BLOCK))
+    digest.update(str(size).encode())
+    return {
+        "path": os.path.abspath(path),
+        "size": size,
+        "mtime": stat.st_mtime_ns,
+        "hash": digest.hexdigest(),
+    }
+
+
+def fingerprint_matches(stored, path, on_refresh=None):
+    """
+    Comprueba si la huella guardada sigue describiendo el fichero; solo rehashea si cambió ruta o mtime.
+    Si el contenido coincide pero cambió la ruta o el mtime (fichero copiado o tocado), pasa la huella
+    actual a on_refresh para que quien la guardó la actualice y no haya que rehashear cada vez.
+    """
+    if not stored:
+        return False
+    stat = os.stat(path)
+    if stored.get("size") != stat.st_size:
+        return False
+    if stored.get("path") == os.path.abspath(path) and stored.get("mtime") == stat.st_mtime_ns:
+        return True
+    actual = file_fingerprint(path)
+    if stored.get("hash") != actual["hash"]:
+        return False
+    if on_refresh is not None:
+        on_refresh(actual)
+    return True
+
+class UnsupportedEncoding(ValueError):
+    """El lector de polars solo decodifica UTF-8."""
+    pass
+
+
 class File:
     """Clase base genérica para representar un fichero."""
     def __init__(self, name, path):
@@ -19,97 +82,380 @@ class File:
         self.path = path
 
 class SQLiteFileLoader:
+    INGEST_BATCH_SIZE = 50_000  # Filas por lote al volcar el fichero a la caché
+    REPLACE_ATTEMPTS = 10  # Intentos de sustituir una caché que algún lector aún tiene abierta
+    REPLACE_RETRY_DELAY = 0.2  # Segundos entre intentos
+    backend = "sqlite"
+
     def __init__(self):
         self._db_path = None
+        self._wanted_indexes = {}
+        self.indexes = {}  # Índices presentes en la tabla data: nombre -> columnas
 
-    def load(self, extractor_file):
-        self._ensure_db_polars(extractor_file)
-        conn = sqlite3.connect(self._db_path)
-        df = pd.read_sql_query("SELECT * FROM data", conn)
-        conn.close()
+    def load(self, extractor_file, token=None):
+        self._ensure_db_polars(extractor_file, token)
+        with SQLitePool.connection(self._db_path) as conn:
+            df = pd.read_sql_query("SELECT * FROM data", conn)
         df = df.astype(str)
         df.columns = [str(x).upper().strip() for x in df.columns]
         return df
 
-    def load_partial(self, extractor_file, columns):
-        self._ensure_db_polars(extractor_file)
-        conn = sqlite3.connect(self._db_path)
+    def load_partial(self, extractor_file, columns, token=None):
+        self._ensure_db_polars(extractor_file, token)
         cols = ','.join([f'"{col}"' for col in columns])
         query = f"SELECT {cols} FROM data"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        with SQLitePool.connection(self._db_path) as conn:
+            df = pd.read_sql_query(query, conn)
         df = df.astype(str)
         df.columns = [str(x).upper().strip() for x in df.columns]
         return df
 
-    def _ensure_db_polars(self, extractor_file):
-        if self._db_path is None:
-            db_dir = os.path.join(extractor_file.file_path, ".sqlite_cache")
-            os.makedirs(db_dir, exist_ok=True)
-            db_name = f"{extractor_file.file}_cache.sqlite"
-            self._db_path = os.path.join(db_dir, db_name)
-        if not os.path.exists(self._db_path):
-            print("cargando la base de datos con polars")
-            metadata = extractor_file.config_content['metadata']
-            file_path = extractor_file.find_file(extractor_file.file_path, extractor_file.file, metadata["Extension"])
-            estructura = extractor_file.config_content['structure']
-            try:
-                column_names = [campo["name"].upper() for campo in estructura]
-                if not metadata.get("Header", True):
-                    pl_df = pl.read_csv(
-                        file_path,
-                        separator=metadata["Separator"],
-                        encoding=metadata["Encoding"],
-                        has_header=False,
-                        new_columns=column_names
-                    )
-                else:
-                    pl_df = pl.read_csv(
-                        file_path,
-                        separator=metadata["Separator"],
-                        encoding=metadata["Encoding"],
-                        has_header=True
-                    )
-                pl_df = pl_df.with_columns([pl.col(col).cast(pl.Utf8) for col in pl_df.columns])
-                pl_df = pl_df.with_row_count("LINE_NUMBER", offset=1)
-                df = pl_df.to_pandas()
-                df = df.astype(str)
-                df.columns = [str(x).upper().strip() for x in df.columns]
-                del pl_df
-                gc.collect()
-            except Exception:
-                print("cargando la base de datos con pandas")
-                if not metadata.get("Header", True):
-                    column_names = [campo["name"].upper() for campo in estructura]
-                    df = pd.read_csv(
-                        file_path,
-                        sep=metadata["Separator"],
-                        encoding=metadata["Encoding"],
-                        dtype=str,
-                        keep_default_na=False,
-                        header=None,
-                        names=column_names
-                    )
-                    df.columns = [str(x).upper().strip() for x in column_names]
-                else:
-                    df = pd.read_csv(
-                        file_path,
-                        sep=metadata["Separator"],
-                        encoding=metadata["Encoding"],
-                        dtype=str,
-                        keep_default_na=False,
-                        header=0
-                    )
-                    df.columns = [str(x).upper().strip() for x in df.columns]
-                df.insert(0, "LINE_NUMBER", range(1, len(df) + 1))
-                df = df.astype(str)
+    def prepare(self, extractor_file, usar_polars=False, token=None):
+        """Deja lista la caché que van a leer los tests. Con polars se escanea el fichero fuente y no hace falta."""
+        if not usar_polars:
+            self._ensure_db_polars(extractor_file, token)
+
+    @staticmethod
+    def _cache_dir(extractor_file):
+        db_dir = os.path.join(extractor_file.file_path, ".sqlite_cache")
+        os.makedirs(db_dir, exist_ok=True)
+        return db_dir
+
+    def _ensure_db_polars(self, extractor_file, token=None):
+        cache_path = os.path.join(self._cache_dir(extractor_file), f"{extractor_file.file}_cache.sqlite")
+        self._wanted_indexes = self._index_specs(extractor_file.config_content['structure'])
+        # _db_path es la versión vigente de la caché, que puede no ser cache_path (ver _install_cache)
+        self._db_path = self._ensure_cache(extractor_file, cache_path, self._read_sqlite_fingerprint,
+                                           self._refresh_sqlite_fingerprint, self._write_batches, token)
+        self._ensure_indexes(cache_path, token)
+
+    @staticmethod
+    def _index_specs(estructura):
+        """
+        Índices a mantener sobre data: uno compuesto con las columnas PK y uno por cada campo
+        marcado con 'index' en structure.yaml. LINE_NUMBER ya es el rowid y no necesita índice.
+        """
+        specs = {}
+        columnas_pk = [campo['name'].upper() for campo in estructura if campo.get('pk')]
+        if columnas_pk:
+            specs["idx_data_pk"] = columnas_pk
+        for campo in estructura:
+            if campo.get('index'):
+                specs[f"idx_data_{campo['name'].lower()}"] = [campo['name'].upper()]
+        return specs
+
+    def has_index(self, columns):
+        """Indica si algún índice de data empieza por estas columnas (en este orden)."""
+        columns = [col.upper() for col in columns]
+        return any(cols[:len(columns)] == columns for cols in self.indexes.values())
+
+    def _ensure_indexes(self, cache_path, token=None):
+        """Crea los índices que falten, por ejemplo en cachés anteriores o si cambió la PK."""
+        if self._wanted_indexes.items() <= self.indexes.items():
+            return
+        token = token or CancellationToken()
+        # La pausa se atiende antes de tomar el lock: dentro solo se comprueba la cancelación
+        token.check()
+        with CacheBuildLock(cache_path):
             conn = sqlite3.connect(self._db_path)
-            df.to_sql("data", conn, index=False, dtype={col: "TEXT" for col in df.columns})
-            conn.close()
-            del df
-            gc.collect()
+            try:
+                self.indexes = self._read_meta(conn, "indexes") or {}
+                if not self._wanted_indexes.items() <= self.indexes.items():
+                    with token.watch(conn, pause=False), conn:
+                        self._create_indexes(conn)
+            finally:
+                conn.close()
+
+    def _create_indexes(self, conn):
+        """Crea los índices pendientes con pragmas pensados para ordenar mucho volumen y los registra en cache_meta."""
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(data)')}
+        cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+        # Caché de páginas acotada y ordenación en disco: el pico de memoria no crece con el fichero
+        conn.execute("PRAGMA cache_size = -65536")  # 64 MB
+        conn.execute("PRAGMA temp_store = FILE")
+        conn.execute(f"PRAGMA threads = {min(os.cpu_count() or 1, 8)}")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (key TEXT PRIMARY KEY, value TEXT)")
+        for name, columns in self._wanted_indexes.items():
+            if self.indexes.get(name) == columns or not set(columns) <= existing:
+                continue
+            print(f"creando índice {name} sobre {', '.join(columns)}")
+            cols = ', '.join(f'"{col}"' for col in columns)
+            conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+            conn.execute(f'CREATE INDEX "{name}" ON data ({cols})')
+            self.indexes[name] = columns
+        conn.execute(f"PRAGMA cache_size = {cache_size}")
+        conn.execute("PRAGMA shrink_memory")
+        conn.execute("PRAGMA analysis_limit = 1000")
+        conn.execute("ANALYZE")
+        conn.execute("INSERT OR REPLACE INTO cache_meta VALUES ('indexes', ?)", (json.dumps(self.indexes),))
+
+    def _ensure_cache(self, extractor_file, cache_path, read_fingerprint, refresh_fingerprint, write_batches,
+                      token=None):
+        """
+        Reutiliza la caché si su huella coincide con el fichero fuente; si no, la reconstruye.
+        Devuelve la ruta de la versión vigente de la caché. Con refresh_fingerprint(ruta, huella),
+        una caché de un fichero copiado o tocado pero con el mismo contenido guarda la huella nueva.
+        Solo construye el primero que llega (hilo o proceso); el resto espera al lock y reutiliza su resultado.
+        La construcción comprueba el token en cada lote y se puede interrumpir a mitad de consulta.
+        La pausa solo se atiende antes de tomar el lock: pausar con el lock tomado bloquearía a
+        los demás que esperan la caché, visor incluido.
+        """
+        metadata = extractor_file.config_content['metadata']
+        file_path = extractor_file.find_file(extractor_file.file_path, extractor_file.file, metadata["Extension"])
+        vigente = self._current_version(cache_path)
+        if vigente and self._cache_matches(vigente, file_path, read_fingerprint, refresh_fingerprint):
+            print("la caché ya estaba cargada")
+            return vigente
+        token = token or CancellationToken()
+        token.check()
+        with CacheBuildLock(cache_path):
+            vigente = self._current_version(cache_path)
+            if vigente and self._cache_matches(vigente, file_path, read_fingerprint, refresh_fingerprint):
+                print("la caché la construyó otra tarea mientras se esperaba")
+                return vigente
+            if vigente:
+                print("el fichero fuente ha cambiado, se reconstruye la caché")
+            tmp_path = self._tmp_path(cache_path)
+            self._build_cache(extractor_file, file_path, tmp_path, write_batches, token)
+            return self._install_cache(tmp_path, cache_path)
+
+    @staticmethod
+    def _cache_matches(cache_path, file_path, read_fingerprint, refresh_fingerprint):
+        on_refresh = None
+        if refresh_fingerprint is not None:
+            on_refresh = lambda fingerprint: refresh_fingerprint(cache_path, fingerprint)
+        return fingerprint_matches(read_fingerprint(cache_path), file_path, on_refresh)
+
+    def _install_cache(self, tmp_path, cache_path):
+        """
+        Pone en su sitio la caché recién construida y devuelve su ruta. En Windows no se puede
+        sustituir un fichero abierto (conexiones del pool, el pager del visor, otro proceso): se
+        reintenta un rato y, si sigue abierto, la caché nueva queda aparte como
+        <caché>.<n><ext>, que _current_version prefiere por ser la más reciente.
+        """
+        for _ in range(self.REPLACE_ATTEMPTS):
+            SQLitePool.close_path(cache_path)
+            try:
+                # Un -wal antiguo aplicado sobre la base de datos nueva la corrompería
+                for suffix in ("-wal", "-shm"):
+                    if os.path.exists(cache_path + suffix):
+                        os.remove(cache_path + suffix)
+                os.replace(tmp_path, cache_path)
+                break
+            except PermissionError:
+                time.sleep(self.REPLACE_RETRY_DELAY)
         else:
-            print("la base de datos ya estaba cargada")
+            root, ext = os.path.splitext(cache_path)
+            version_path = f"{root}.{time.time_ns()}{ext}"
+            print(f"la caché anterior sigue abierta, la nueva se guarda como {os.path.basename(version_path)}")
+            os.replace(tmp_path, version_path)
+            self._remove_old_versions(cache_path, keep=version_path)
+            return version_path
+        self._remove_old_versions(cache_path, keep=cache_path)
+        return cache_path
+
+    @staticmethod
+    def _cache_versions(cache_path):
+        """La caché y las versiones aparte que dejó _install_cache, de la más reciente a la más antigua."""
+        root, ext = os.path.splitext(cache_path)
+        rutas = [cache_path] + [ruta for ruta in glob.glob(f"{glob.escape(root)}.*{ext}")
+                                if ruta[len(root) + 1:len(ruta) - len(ext)].isdigit()]
+        versiones = []
+        for ruta in rutas:
+            try:
+                versiones.append((os.path.getmtime(ruta), ruta))
+            except OSError:
+                pass
+        return [ruta for _, ruta in sorted(versiones, reverse=True)]
+
+    def _current_version(self, cache_path):
+        versiones = self._cache_versions(cache_path)
+        return versiones[0] if versiones else None
+
+    def _remove_old_versions(self, cache_path, keep):
+        # Las que aún tenga abiertas algún lector se quedan: se borrarán en otra reconstrucción
+        for ruta in self._cache_versions(cache_path):
+            if ruta == keep or ruta == cache_path:
+                continue
+            SQLitePool.close_path(ruta)
+            for sufijo in ("", "-wal", "-shm"):
+                try:
+                    os.remove(ruta + sufijo)
+                except OSError:
+                    pass
+
+    def _build_cache(self, extractor_file, file_path, tmp_path, write_batches, token):
+        metadata = extractor_file.config_content['metadata']
+        estructura = extractor_file.config_content['structure']
+        column_names = [campo["name"].upper() for campo in estructura]
+        # La huella se toma antes de leer para no dar por buena una copia a medio escribir
+        fingerprint = file_fingerprint(file_path)
+        try:
+            print("cargando la caché con polars")
+            batches = self._read_batches_polars(file_path, metadata, column_names)
+            write_batches(tmp_path, self._numbered_batches(batches, column_names, token), fingerprint, token)
+        except Exception:
+            print("cargando la caché con pandas")
+            batches = self._read_batches_pandas(file_path, metadata, column_names)
+            write_batches(tmp_path, self._numbered_batches(batches, column_names, token), fingerprint, token)
+        gc.collect()
+
+    def _read_sqlite_fingerprint(self, db_path):
+        try:
+            conn = sqlite3.connect(db_path)
+            try:
+                fingerprint = self._read_meta(conn, "fingerprint")
+                self.indexes = self._read_meta(conn, "indexes") or {}
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # Cachés antiguas sin tabla cache_meta: se reconstruyen
+            return None
+        return fingerprint
+
+    @staticmethod
+    def _refresh_sqlite_fingerprint(db_path, fingerprint):
+        try:
+            conn = sqlite3.connect(db_path)
+            try:
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO cache_meta VALUES ('fingerprint', ?)",
+                                 (json.dumps(fingerprint),))
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # Solo se pierde el atajo: la próxima vez se vuelve a comparar el hash
+            pass
+
+    @staticmethod
+    def _read_meta(conn, key):
+        row = conn.execute("SELECT value FROM cache_meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @staticmethod
+    def _polars_csv_options(metadata, column_names):
+        encoding = str(metadata["Encoding"]).lower().replace('-', '')
+        if encoding != 'utf8':
+            raise UnsupportedEncoding(f"Encoding no soportado por polars: {metadata['Encoding']}")
+        header = metadata.get("Header", True)
+        return dict(
+            separator=metadata["Separator"],
+            has_header=header,
+            new_columns=None if header else column_names,
+            infer_schema_length=0,
+        )
+
+    def scan(self, extractor_file, token=None):
+        """
+        LazyFrame sobre el fichero fuente con las mismas columnas y LINE_NUMBER que la caché,
+        para validar con polars sin pasar por SQLite.
+        """
+        metadata = extractor_file.config_content['metadata']
+        file_path = extractor_file.find_file(extractor_file.file_path, extractor_file.file, metadata["Extension"])
+        column_names = [campo["name"].upper() for campo in extractor_file.config_content['structure']]
+        lf = pl.scan_csv(file_path, **self._polars_csv_options(metadata, column_names))
+        lf = lf.select(pl.all().fill_null("").name.map(lambda col: col.upper().strip()))
+        if hasattr(lf, "with_row_index"):
+            lf = lf.with_row_index("LINE_NUMBER", offset=1)
+        else:
+            lf = lf.with_row_count("LINE_NUMBER", offset=1)
+        return lf.with_columns(pl.col("LINE_NUMBER").cast(pl.Int64))
+
+    def _read_batches_polars(self, file_path, metadata, column_names):
+        """Lee el fichero en lotes de INGEST_BATCH_SIZE filas, todas las columnas como texto."""
+        options = self._polars_csv_options(metadata, column_names)
+        if hasattr(pl, "read_csv_batched"):
+            reader = pl.read_csv_batched(file_path, batch_size=self.INGEST_BATCH_SIZE, **options)
+            batches = reader.next_batches(1)
+            while batches:
+                yield from batches
+                batches = reader.next_batches(1)
+        else:
+            yield from pl.scan_csv(file_path, **options).collect_batches(chunk_size=self.INGEST_BATCH_SIZE)
+
+    def _read_batches_pandas(self, file_path, metadata, column_names):
+        header = metadata.get("Header", True)
+        reader = pd.read_csv(
+            file_path,
+            sep=metadata["Separator"],
+            encoding=metadata["Encoding"],
+            dtype=str,
+            keep_default_na=False,
+            header=0 if header else None,
+            names=None if header else column_names,
+            chunksize=self.INGEST_BATCH_SIZE
+        )
+        with reader:
+            for chunk in reader:
+                yield pl.from_pandas(chunk)
+
+    @staticmethod
+    def _numbered_batches(batches, column_names, token):
+        """
+        Normaliza los lotes leídos: nombres en mayúsculas, vacíos como '' y LINE_NUMBER
+        como primera columna. Si el fichero está vacío emite un único lote sin filas.
+        """
+        line_number = 0
+        empty = True
+        for batch in batches:
+            token.check(pause=False)
+            empty = False
+            batch = batch.fill_null("")
+            batch.columns = [str(x).upper().strip() for x in batch.columns]
+            lines = pl.Series("LINE_NUMBER", range(line_number + 1, line_number + 1 + batch.height), dtype=pl.Int64)
+            line_number += batch.height
+            yield batch.insert_column(0, lines)
+        if empty:
+            yield pl.DataFrame(
+                [pl.Series("LINE_NUMBER", [], dtype=pl.Int64)] + [pl.Series(col, [], dtype=pl.Utf8) for col in column_names]
+            )
+
+    def _write_batches(self, tmp_path, batches, fingerprint, token):
+        """
+        Vuelca los lotes en la tabla data de tmp_path dentro de una única transacción.
+        Solo hay un lote en memoria a la vez, así que el consumo no depende del tamaño del fichero.
+        """
+        conn = sqlite3.connect(tmp_path)
+        try:
+            # Sin journal ni fsync durante la carga: si algo falla se descarta el temporal entero
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+            insert = None
+            with token.watch(conn, pause=False), conn:
+                conn.execute("BEGIN")
+                for batch in batches:
+                    if insert is None:
+                        insert = self._create_table(conn, batch.columns[1:])
+                    conn.executemany(insert, batch.rows())
+                conn.execute("CREATE TABLE cache_meta (key TEXT PRIMARY KEY, value TEXT)")
+                conn.execute("INSERT INTO cache_meta VALUES ('fingerprint', ?)", (json.dumps(fingerprint),))
+                self.indexes = {}
+                self._create_indexes(conn)
+            # En WAL los lectores del pool no se bloquean con escrituras posteriores (índices nuevos)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.close()
+        except BaseException:
+            # También al cancelar: el temporal a medias no sirve
+            conn.close()
+            os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _tmp_path(cache_path):
+        """Fichero temporal junto a la caché; solo se renombra sobre ella cuando está completo."""
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return tmp_path
+
+    @staticmethod
+    def _create_table(conn, columns):
+        # LINE_NUMBER como INTEGER PRIMARY KEY es alias del rowid: ordena y filtra por línea sin índice extra
+        cols = ', '.join(f'"{col}" TEXT' for col in columns)
+        conn.execute(f'CREATE TABLE data ("LINE_NUMBER" INTEGER PRIMARY KEY, {cols})')
+        placeholders = ', '.join('?' * (len(columns) + 1))
+        return f'INSERT INTO data VALUES ({placeholders})'
 
     @staticmethod
     def clear_sqlite_cache(input_folder):
@@ -117,39 +463,121 @@ class SQLiteFileLoader:
         existe = os.path.exists(cache_dir)
         if os.path.exists(cache_dir):
             for fname in os.listdir(cache_dir):
-                if fname.endswith("_cache.sqlite"):
+                # También las versiones aparte de _install_cache: <fichero>_cache.<n>.sqlite
+                if "_cache." in fname and fname.endswith((".sqlite", ".sqlite-wal", ".sqlite-shm", ".arrow", ".tmp")):
                     try:
+                        SQLitePool.close_path(os.path.join(cache_dir, fname))
                         os.remove(os.path.join(cache_dir, fname))
                     except Exception as e:
                         print(f"Error eliminando {fname}: {e}")
 
+class ArrowFileLoader(SQLiteFileLoader):
+    """
+    Caché columnar en Arrow IPC. load, load_partial y los tests leen con memory-map
+    solo las columnas pedidas; el SQLite solo se construye si alguien lo necesita (visor SQL).
+    """
+    backend = "arrow"
+
+    def __init__(self):
+        super().__init__()
+        self._arrow_path = None
+
+    def load(self, extractor_file, token=None):
+        self._ensure_arrow(extractor_file, token)
+        return self._to_pandas(pl.read_ipc(self._arrow_path))
+
+    def load_partial(self, extractor_file, columns, token=None):
+        self._ensure_arrow(extractor_file, token)
+        return self._to_pandas(pl.read_ipc(self._arrow_path, columns=list(columns)))
+
+    def scan(self, extractor_file, token=None):
+        self._ensure_arrow(extractor_file, token)
+        return pl.scan_ipc(self._arrow_path)
+
+    def prepare(self, extractor_file, usar_polars=False, token=None):
+        if usar_polars:
+            self._ensure_arrow(extractor_file, token)
+        else:
+            self._ensure_db_polars(extractor_file, token)
+
+    def _ensure_arrow(self, extractor_file, token=None):
+        cache_path = os.path.join(self._cache_dir(extractor_file), f"{extractor_file.file}_cache.arrow")
+        # La huella de Arrow va en el pie del fichero y actualizarla obliga a reescribirlo entero:
+        # sale más barato volver a comparar el hash de los bloques muestreados (sin refresh)
+        self._arrow_path = self._ensure_cache(extractor_file, cache_path, self._read_arrow_fingerprint, None,
+                                              self._write_arrow_batches, token)
+
+    @staticmethod
+    def _read_arrow_fingerprint(arrow_path):
+        try:
+            with pa.memory_map(arrow_path) as source:
+                metadata = pa.ipc.open_file(source).schema.metadata or {}
+        except (OSError, pa.ArrowInvalid):
+            return None
+        value = metadata.get(b"fingerprint")
+        return json.loads(value) if value else None
+
+    def _write_arrow_batches(self, tmp_path, batches, fingerprint, token):
+        writer = None
+        # En Arrow la huella viaja en los metadatos del esquema
+        schema_metadata = {b"fingerprint": json.dumps(fingerprint).encode()}
+        try:
+            with pa.OSFile(tmp_path, 'wb') as sink:
+                for batch in batches:
+                    table = batch.to_arrow().replace_schema_metadata(schema_metadata)
+                    if writer is None:
+                        writer = pa.ipc.new_file(sink, table.schema)
+                    writer.write_table(table)
+                writer.close()
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _to_pandas(pl_df):
+        df = pl_df.to_pandas().astype(str)
+        df.columns = [str(x).upper().strip() for x in df.columns]
+        return df
+
+
+# Backend de caché por scope: clave "Cache" del metadata.yaml
+CACHE_LOADERS = {
+    "sqlite": SQLiteFileLoader,
+    "arrow": ArrowFileLoader,
+}
+
+
 class FileContentCache:
-    """Caché LRU basada en memoria usada por los ficheros."""
+    """Caché LRU basada en memoria usada por los ficheros. Segura entre hilos."""
     _cache = collections.OrderedDict()
     _max_bytes = 200 * 1024 * 1024  # 200 MB por defecto, ajusta según tu entorno
+    _lock = threading.RLock()
 
     @classmethod
     def get(cls, key):
-        if key in cls._cache:
-            cls._cache.move_to_end(key)
-            return cls._cache[key][0]
-        return None
+        with cls._lock:
+            if key in cls._cache:
+                cls._cache.move_to_end(key)
+                return cls._cache[key][0]
+            return None
 
     @classmethod
     def set(cls, key, value):
         size = cls._estimate_size(value)
-        cls._cache[key] = (value, size)
-        cls._cache.move_to_end(key)
-        cls._evict_if_needed()
+        with cls._lock:
+            cls._cache[key] = (value, size)
+            cls._cache.move_to_end(key)
+            cls._evict_if_needed()
 
     @classmethod
     def remove(cls, key):
-        if key in cls._cache:
-            del cls._cache[key]
+        with cls._lock:
+            cls._cache.pop(key, None)
 
     @classmethod
     def clear(cls):
-        cls._cache.clear()
+        with cls._lock:
+            cls._cache.clear()
 
     @classmethod
     def _evict_if_needed(cls):
@@ -177,16 +605,22 @@ class FileContentCache:
 
 class ExtractorFile(File):
     """Entidad de fichero de extracción, con soporte para estrategias de carga."""
-    def __init__(self, scope, version, file, file_path):
+    def __init__(self, scope, version, file, file_path, config_content=None, scopes_path=None):
         super().__init__(file, file_path)
         self.scope = scope
         self.version = version
-        self.initial_path = os.path.join(MODULE_BASE, 'data/scopes', self.scope)
-        self.specific_path = os.path.join(MODULE_BASE, 'data/scopes', self.scope, self.version, self.name)
-        self.config_content = self.load_config()
+        # scopes_path permite leer los scopes de otra carpeta (p.ej. --scopes de la línea de comandos)
+        scopes_path = scopes_path or os.path.join(MODULE_BASE, 'data/scopes')
+        self.initial_path = os.path.join(scopes_path, self.scope)
+        self.specific_path = os.path.join(scopes_path, self.scope, self.version, self.name)
+        # config_content permite construir el fichero sin scope en disco (benchmarks, comprobaciones)
+        self.config_content = config_content if config_content is not None else self.load_config()
         self._file_content = None  # Lazy loading
         self.log = ''
-        self.loader = SQLiteFileLoader()
+        self.profiler = Profiler(self.name)
+        self.fingerprint = None  # Huella del fichero fuente validado; la toma la ingesta, una vez por fichero
+        cache = self.config_content['metadata'].get('Cache', 'sqlite')
+        self.loader = CACHE_LOADERS[str(cache).lower()]()
 
     @property
     def file_path(self):
@@ -217,17 +651,30 @@ class ExtractorFile(File):
 
     def load_file(self):
         print(f"Cargando contenido de {self.scope}|{self.version}|{self.file_path}|{self.file}...")
-        start_load = time.time()
-        process = psutil.Process(os.getpid())
-        mem_before = process.memory_info().rss
-        file_content = self.loader.load(self)
-        mem_after = process.memory_info().rss
-        end_load = time.time()
-        mem_mb = (mem_after - mem_before) / (1024 * 1024)
-        self.log += (f"🕒 Tiempo Carga: {end_load - start_load:.2f} segundos\n")
-        self.log += (f"🧠 Memoria consumida: {mem_mb:.2f} MB\n")
+        with self.profiler.span("load_file") as span:
+            file_content = self.loader.load(self)
+            span.rows = len(file_content)
+        self.log += (f"🕒 Tiempo Carga: {span.wall:.2f} segundos\n")
+        self.log += (f"🧠 Pico de memoria: {span.peak_rss / (1024 * 1024):.2f} MB\n")
         return file_content
 
+    def source_size(self):
+        """Tamaño en bytes del fichero fuente, 0 si todavía no se encuentra."""
+        try:
+            extension = self.config_content['metadata']['Extension']
+            return os.path.getsize(self.find_file(self.file_path, self.file, extension))
+        except (FileNotFoundError, KeyError, TypeError):
+            return 0
+
+    def take_fingerprint(self):
+        """Toma la huella del fichero fuente y la guarda en fingerprint; None si todavía no se encuentra."""
+        try:
+            extension = self.config_content['metadata']['Extension']
+            self.fingerprint = file_fingerprint(self.find_file(self.file_path, self.file, extension))
+        except (FileNotFoundError, KeyError, TypeError):
+            self.fingerprint = None
+        return self.fingerprint
+
     def find_file(self, directorio, nombre_base, extension):
         patron = os.path.join(directorio, f"{nombre_base}*{'.' + extension}")
         archivos = glob.glob(patron)
@@ -1,66 +1,363 @@
-import sqlite3
-import pandas as pd
-from PySide6.QtCore import Qt, QThread, Signal, QObject
+import collections
+import threading
+from PySide6.QtCore import Qt, QThread, Signal, QObject, QAbstractTableModel, QModelIndex, QRunnable, QThreadPool, \
+    Slot, QTimer
 from PySide6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QTableWidget, \
-    QTableWidgetItem, QProgressBar, QWidget
+    QTableWidgetItem, QProgressBar, QWidget, QHeaderView, QAbstractItemView, QTextEdit, QFileDialog
 import os
 from widgets.inputs.danger_button import DangerButton
 from widgets.inputs.labeled_lineedit import LabeledLineEdit
+from widgets.inputs.labeled_combobox import LabeledComboBox
 from widgets.inputs.primary_button import PrimaryButton
 from widgets.inputs.secondary_button import SecondaryButton
 from widgets.results_table_widget import ResultsTableWidget
+from modules.extraccion.src.profiling import Profiler, export_chrome_trace
+from modules.extraccion.src.viewer_query import QueryPager, as_text, display_text
+from modules.extraccion.src.cancellation import CancellationToken, Cancelled
 
 MODULE_BASE = os.path.dirname(os.path.dirname(__file__))
 
 
+def block_columns(df):
+    """Columnas de un bloque como listas de textos ya convertidos, para servirlos en data() tal cual."""
+    return [[display_text(valor) for valor in df.iloc[:, i]] for i in range(df.shape[1])]
+
+
+def block_bytes(columnas):
+    # Texto más la cabecera de cada str y su puntero en la lista (~57 bytes en CPython)
+    return sum(len(valor) + 57 for valores in columnas for valor in valores)
+
+
 class FileLoaderWorker(QObject):
-    finished = Signal(object)
-    error = Signal(str)
+    finished = Signal(object, int, object)  # pager, página, DataFrame
+    error = Signal(object, str)
+    cancelled = Signal(object)
 
-    def __init__(self, extractor_file, sql_query, page_start, page_size):
+    def __init__(self, pager, page, profiler, token):
         super().__init__()
-        self.extractor_file = extractor_file
-        self.sql_query = sql_query
-        self.page_start = page_start
-        self.page_size = page_size
+        self.pager = pager
+        self.page = page
+        self.profiler = profiler
+        self.token = token
 
     def run(self):
         try:
-            self.extractor_file.loader._ensure_db_polars(self.extractor_file)
-            db_path = self.extractor_file.loader._db_path
-            conn = sqlite3.connect(db_path)
-            # Si no hay consulta, muestra todo paginado
-            if not self.sql_query:
-                query = f"SELECT * FROM data LIMIT {self.page_size} OFFSET {self.page_start}"
-            else:
-                # Si la consulta ya tiene LIMIT/OFFSET, no lo añadimos
-                q = self.sql_query.lower()
-                if "limit" in q or "offset" in q:
-                    query = self.sql_query
-                else:
-                    query = f"{self.sql_query} LIMIT {self.page_size} OFFSET {self.page_start}"
-            df = pd.read_sql_query(query, conn)
-            conn.close()
-            df = df.astype(str)
+            with self.profiler.span("page_fetch", offset=self.page * self.pager.page_size) as span:
+                df = self.pager.fetch_page(self.page, self.token)
+                span.rows = len(df)
+            # Sin coste: máximo LINE_NUMBER o recuento guardado de una ejecución anterior
+            self.pager.cached_count()
+            df = as_text(df)
             df.columns = [str(x).upper().strip() for x in df.columns]
-            self.finished.emit(df)
+            self.finished.emit(self.pager, self.page, df)
+        except Cancelled:
+            self.cancelled.emit(self.pager)
+        except Exception as e:
+            self.error.emit(self.pager, str(e))
+
+
+class RowCountWorker(QObject):
+    finished = Signal(object, int)  # pager, filas
+    error = Signal(object, str)
+    cancelled = Signal(object)
+
+    def __init__(self, pager, profiler, token):
+        super().__init__()
+        self.pager = pager
+        self.profiler = profiler
+        self.token = token
+
+    def run(self):
+        try:
+            with self.profiler.span("count") as span:
+                span.rows = self.pager.exact_count(self.token)
+            self.finished.emit(self.pager, span.rows)
+        except Cancelled:
+            self.cancelled.emit(self.pager)
         except Exception as e:
-            self.error.emit(str(e))
+            self.error.emit(self.pager, str(e))
+
+
+class BlockSignals(QObject):
+    loaded = Signal(int, object, bool)  # bloque, (columnas, bytes), si era anticipado
+    failed = Signal(int, str)  # bloque, mensaje de error
+
+
+class BlockLoader(QRunnable):
+    """
+    Trae bloques del pager empezando por el último pedido, que es el que está en pantalla, y
+    solo cuando no queda ninguno pedido, los anticipados.
+    """
+
+    def __init__(self, requests, pager, profiler, signals):
+        super().__init__()
+        self.requests = requests
+        self.pager = pager
+        self.profiler = profiler
+        self.signals = signals
+
+    @Slot()
+    def run(self):
+        while True:
+            siguiente = self.requests.take()
+            if siguiente is None:
+                return
+            block, prefetch, token = siguiente
+            try:
+                with self.profiler.span("block_prefetch" if prefetch else "block_fetch", block=block) as span:
+                    df = self.pager.fetch_page(block, token)
+                    span.rows = len(df)
+                columnas = block_columns(df)
+            except Cancelled:
+                continue  # Quien canceló ya descartó el bloque
+            except Exception as e:
+                emitir = lambda: self.signals.failed.emit(block, str(e))
+            else:
+                emitir = lambda: self.signals.loaded.emit(block, (columnas, block_bytes(columnas)), prefetch)
+            try:
+                emitir()
+            except RuntimeError:
+                return  # Se cerró el visor y ya no existe el modelo
+
+
+class BlockRequests:
+    """
+    Pila acotada de bloques pedidos por el modelo y cola, más corta, de bloques anticipados.
+    Al desplazarse rápido solo interesan los últimos pedidos: los más antiguos se descartan y
+    vuelven a pedirse si se vuelven a ver. Los bloques se traen con el token actual, que al
+    cancelar interrumpe las lecturas en curso.
+    """
+    max_requests = 8
+    max_prefetch = 4
+
+    def __init__(self, max_loaders=2):
+        self.max_loaders = max_loaders
+        self._blocks = []
+        self._prefetch = []
+        self._loaders = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self.token = CancellationToken()
+
+    def push(self, block, prefetch=False):
+        """Añade el bloque; devuelve los descartados y si hace falta arrancar otro BlockLoader."""
+        with self._lock:
+            if self._closed:
+                return [block], False
+            if prefetch:
+                self._prefetch.append(block)
+            else:
+                # Un bloque anticipado que ya se ve pasa a la pila de pedidos
+                if block in self._prefetch:
+                    self._prefetch.remove(block)
+                self._blocks.append(block)
+            descartados = self._blocks[:-self.max_requests] + self._prefetch[:-self.max_prefetch]
+            del self._blocks[:-self.max_requests]
+            del self._prefetch[:-self.max_prefetch]
+            arrancar = self._loaders < self.max_loaders
+            if arrancar:
+                self._loaders += 1
+        return descartados, arrancar
+
+    def take(self):
+        """Siguiente bloque como (bloque, anticipado, token), o None si el BlockLoader debe terminar."""
+        with self._lock:
+            if self._blocks and not self._closed:
+                return self._blocks.pop(), False, self.token
+            if self._prefetch and not self._closed:
+                return self._prefetch.pop(0), True, self.token
+            self._loaders -= 1
+            return None
+
+    def cancel(self):
+        """Interrumpe las lecturas en curso y descarta las pendientes; se puede seguir pidiendo."""
+        with self._lock:
+            self.token.cancel()
+            self.token = CancellationToken()
+            self._blocks.clear()
+            self._prefetch.clear()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self.token.cancel()
+            self._blocks.clear()
+            self._prefetch.clear()
+
+
+class LazyQueryModel(QAbstractTableModel):
+    """
+    Modelo virtual del visor: presenta todo el resultado de la consulta como una única tabla y
+    trae del pager los bloques de filas que se van viendo, en segundo plano, junto con el
+    anterior y el siguiente de cada uno para que Anterior/Siguiente y el desplazamiento no
+    esperen. Guarda los bloques como columnas de textos en un LRU de hasta max_bytes.
+    """
+    LOADING = "…"
+    max_bytes = 64 * 1024 * 1024
+    block_failed = Signal(int, str)  # bloque, mensaje de error
+
+    def __init__(self, pager, columns, first_block, profiler, parent=None):
+        super().__init__(parent)
+        self.pager = pager
+        self.block_size = pager.page_size
+        self.columns = list(columns)
+        self.profiler = profiler
+        self._blocks = collections.OrderedDict({0: first_block})
+        self._sizes = {0: block_bytes(first_block)}
+        self._bytes = self._sizes[0]
+        self._pending = {}  # bloque -> si se pidió solo por anticipado
+        self._failed = set()  # Bloques que no se pudieron cargar: se muestran vacíos y no se reintentan
+        self._last_block = 0  # Último bloque servido en data()
+        self._closed = False
+        self._requests = BlockRequests()
+        self._signals = BlockSignals()
+        self._signals.loaded.connect(self._on_block_loaded)
+        self._signals.failed.connect(self._on_block_failed)
+        # Sin total conocido se muestran las filas ya vistas y se amplía con fetchMore
+        self._rows = pager.count if pager.count is not None else len(first_block[0]) if first_block else 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._rows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        block, offset = divmod(index.row(), self.block_size)
+        columnas = self._blocks.get(block)
+        if columnas is None:
+            if block in self._failed:
+                return None
+            self.request_block(block)
+            return self.LOADING
+        if block != self._last_block:
+            # Se empieza a ver otro bloque: pasa a ser el más reciente y se anticipan sus vecinos
+            self._last_block = block
+            self._blocks.move_to_end(block)
+            self.prefetch_around(block)
+        valores = columnas[index.column()]
+        return valores[offset] if offset < len(valores) else None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return str(self.columns[section])
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return (not parent.isValid() and self.pager.count is None
+                and self._rows > 0 and self._rows % self.block_size == 0)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self.request_block(self._rows // self.block_size)
+
+    def request_block(self, block, prefetch=False):
+        if self._closed or block in self._failed or (block in self._pending and (prefetch or not self._pending[block])):
+            return
+        self._pending[block] = prefetch
+        descartados, arrancar = self._requests.push(block, prefetch)
+        for descartado in descartados:
+            self._pending.pop(descartado, None)
+        if arrancar:
+            QThreadPool.globalInstance().start(BlockLoader(self._requests, self.pager, self.profiler, self._signals))
+
+    def set_total(self, total):
+        """Llega el recuento exacto: la tabla pasa a tener todas las filas del resultado."""
+        if total > self._rows:
+            self.beginInsertRows(QModelIndex(), self._rows, total - 1)
+            self._rows = total
+            self.endInsertRows()
+
+    def prefetch_around(self, block):
+        # Sin materializar, anticipar un bloque de una consulta obligaría a materializarla (o a un
+        # OFFSET) por si acaso, por delante de los bloques que sí se piden
+        if self.pager.sql_query and not self.pager.materialized:
+            return
+        for vecino in (block + 1, block - 1):
+            if vecino < 0 or vecino in self._blocks or vecino in self._pending:
+                continue
+            inicio = vecino * self.block_size
+            if inicio < self._rows or (inicio == self._rows and self.canFetchMore()):
+                self.request_block(vecino, prefetch=True)
+
+    def cancel_loads(self):
+        """Interrumpe los bloques que se están trayendo; los que se vuelvan a ver se piden de nuevo."""
+        self._requests.cancel()
+        self._pending.clear()
+
+    def close(self):
+        """Deja de traer y anticipar bloques, p.ej. porque el usuario ha lanzado otra consulta."""
+        self._closed = True
+        self._requests.close()
+        self._pending.clear()
+
+    def _on_block_failed(self, block, msg):
+        prefetch = self._pending.pop(block, False)
+        if self._closed or prefetch:
+            return  # Un anticipado que falla se volverá a pedir, y a informar, si llega a verse
+        self._failed.add(block)
+        inicio = block * self.block_size
+        if inicio < self._rows:
+            fin = min(inicio + self.block_size, self._rows) - 1
+            self.dataChanged.emit(self.index(inicio, 0), self.index(fin, len(self.columns) - 1))
+        self.block_failed.emit(block, msg)
+
+    def _on_block_loaded(self, block, cargado, prefetch):
+        self._pending.pop(block, None)
+        if self._closed or not self.columns:
+            return
+        columnas, tamano = cargado
+        self._bytes += tamano - self._sizes.get(block, 0)
+        self._blocks[block] = columnas
+        self._sizes[block] = tamano
+        self._blocks.move_to_end(block)
+        while self._bytes > self.max_bytes and len(self._blocks) > 1:
+            viejo, _ = self._blocks.popitem(last=False)
+            self._bytes -= self._sizes.pop(viejo)
+        inicio = block * self.block_size
+        filas = len(columnas[0])
+        if self.pager.count is None and inicio == self._rows:
+            # Bloque pedido por fetchMore: amplía la tabla y, si viene incompleto, ya se sabe el total
+            if filas:
+                self.beginInsertRows(QModelIndex(), self._rows, self._rows + filas - 1)
+                self._rows += filas
+                self.endInsertRows()
+            if filas < self.block_size:
+                self.pager.count = self._rows
+        elif filas:
+            self.dataChanged.emit(self.index(inicio, 0), self.index(inicio + filas - 1, len(self.columns) - 1))
+        if not prefetch:
+            self.prefetch_around(block)
 
 
 class FileViewerWidget(QWidget):
-    PAGE_SIZE = 1000  # Número de filas por página
+    PAGE_SIZE = 1000  # Filas por bloque del modelo y por salto de Anterior/Siguiente
+    QUERY_TIMEOUTS = {"Sin límite": 0, "10 s": 10, "30 s": 30, "1 min": 60, "5 min": 300}
+    DEFAULT_TIMEOUT = "1 min"
 
     def __init__(self, extractor_file, on_close=None, parent=None):
         super().__init__(parent)
         print("Inicializando visor de archivos...")
         self.extractor_file = extractor_file
         self.file_content = None
-        self.current_page = 0
-        self.total_rows = 0
+        self.model = None
         self.sql_query = ""
         self.filtered_df = None
         self.on_close = on_close
+        self.profiler = Profiler("visor")
+        self.pager = QueryPager(extractor_file, self.sql_query, self.PAGE_SIZE)
+        self.counting = False
+        self.count_note = ""  # Qué pasa con el recuento mientras no se conoce el total
+        self._threads = {}  # QThread en marcha -> worker, hasta que termina
+        # Trabajos de la consulta actual que se pueden cancelar: el primer bloque y el recuento
+        self.load_token = None
+        self.count_token = None
+        self.cancel_reason = ""
+        self.timeout_timer = QTimer(self)
+        self.timeout_timer.setSingleShot(True)
+        self.timeout_timer.timeout.connect(self.on_query_timeout)
 
         layout = QVBoxLayout(self)
 
@@ -80,6 +377,13 @@ class FileViewerWidget(QWidget):
         apply_btn = PrimaryButton("Ejecutar")
         apply_btn.clicked.connect(self.apply_sql_query)
         query_layout.addWidget(apply_btn)
+        self.cancel_btn = SecondaryButton("Cancelar")
+        self.cancel_btn.clicked.connect(lambda: self.cancel_query("cancelada por el usuario"))
+        self.cancel_btn.setEnabled(False)
+        query_layout.addWidget(self.cancel_btn)
+        self.timeout_combo = LabeledComboBox("Tiempo máximo:", items=list(self.QUERY_TIMEOUTS))
+        self.timeout_combo.combobox.setCurrentText(self.DEFAULT_TIMEOUT)
+        query_layout.addWidget(self.timeout_combo)
         layout.addLayout(query_layout)
 
         self.guide_link = QLabel('<a href="#">Guía de filtros SQL</a>')
@@ -88,7 +392,17 @@ class FileViewerWidget(QWidget):
         self.guide_link.setOpenExternalLinks(False)
         self.guide_link.setStyleSheet("color: #1976d2; font-weight: bold;")
         self.guide_link.linkActivated.connect(self.show_filter_guide)
-        layout.addWidget(self.guide_link)
+        self.profile_link = QLabel('<a href="#">Perfil del visor</a>')
+        self.profile_link.setTextFormat(Qt.RichText)
+        self.profile_link.setTextInteractionFlags(Qt.TextBrowserInteraction)
+        self.profile_link.setOpenExternalLinks(False)
+        self.profile_link.setStyleSheet("color: #1976d2; font-weight: bold;")
+        self.profile_link.linkActivated.connect(self.show_profile_dialog)
+        links_layout = QHBoxLayout()
+        links_layout.addWidget(self.guide_link)
+        links_layout.addStretch()
+        links_layout.addWidget(self.profile_link)
+        layout.addLayout(links_layout)
 
         self.error_label = QLabel("")
         self.error_label.setStyleSheet("color: red; font-weight: bold;")
@@ -96,6 +410,11 @@ class FileViewerWidget(QWidget):
         layout.addWidget(self.error_label)
 
         self.table = ResultsTableWidget(self)
+        # Ajustar al contenido en cada bloque que llega obligaría a medir millones de filas
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        # Y al medir solo se miran las filas visibles, no las 1000 primeras
+        self.table.horizontalHeader().setResizeContentsPrecision(0)
+        self.table.table.verticalScrollBar().valueChanged.connect(self.update_page_controls)
         layout.addWidget(self.table)
 
         pag_layout = QHBoxLayout()
@@ -118,24 +437,78 @@ class FileViewerWidget(QWidget):
 
     def handle_close(self):
         print("Cerrando visor de archivos...")
+        self.cancel_query("visor cerrado")
+        if self.model is not None:
+            self.model.close()
+        self.pager.close()
         if self.on_close:
             self.on_close()
         # Si está en un QStackedWidget, puede ocultarse/eliminarse desde fuera
 
+    def _start_worker(self, worker, on_finished, on_error, on_cancelled):
+        thread = QThread()
+        worker.moveToThread(thread)
+        thread.started.connect(worker.run)
+        worker.finished.connect(on_finished)
+        worker.error.connect(on_error)
+        worker.cancelled.connect(on_cancelled)
+        worker.finished.connect(thread.quit)
+        worker.error.connect(thread.quit)
+        worker.cancelled.connect(thread.quit)
+        thread.finished.connect(self._on_thread_finished)
+        # Se guarda la referencia hasta que el hilo acaba: un QThread destruido en marcha aborta la app
+        self._threads[thread] = worker
+        thread.start()
+
+    def _on_thread_finished(self):
+        thread = self.sender()
+        worker = self._threads.pop(thread, None)
+        if worker is not None:
+            worker.deleteLater()
+        thread.deleteLater()
+
     def start_loading_threaded(self):
         # self.loading_label.setVisible(True)
         # self.progress_bar.setVisible(True)
         self.set_widgets_enabled(False)
-        self.thread = QThread()
-        self.worker = FileLoaderWorker(self.extractor_file, self.sql_query, self.current_page * self.PAGE_SIZE, self.PAGE_SIZE)
-        self.worker.moveToThread(self.thread)
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.on_loaded)
-        self.worker.error.connect(self.on_error)
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
-        self.thread.start()
+        self.load_token = CancellationToken()
+        worker = FileLoaderWorker(self.pager, 0, self.profiler, self.load_token)
+        self._start_worker(worker, self.on_loaded, self.on_error, self.on_load_cancelled)
+        self.update_cancel_button()
+
+    def start_counting(self):
+        if self.counting or self.pager.count is not None:
+            return
+        self.counting = True
+        self.count_note = "contando..."
+        self.count_token = CancellationToken()
+        worker = RowCountWorker(self.pager, self.profiler, self.count_token)
+        self._start_worker(worker, self.on_counted, self.on_count_error, self.on_count_cancelled)
+        self.update_cancel_button()
+
+    def start_query_timeout(self):
+        segundos = self.QUERY_TIMEOUTS.get(self.timeout_combo.currentText(), 0)
+        self.timeout_timer.stop()
+        if segundos and self.pager.sql_query:
+            self.timeout_timer.start(segundos * 1000)
+
+    def on_query_timeout(self):
+        self.cancel_query(f"superó el tiempo máximo de {self.timeout_combo.currentText()}")
+
+    def cancel_query(self, reason):
+        """Interrumpe el primer bloque, el recuento y los bloques que se estén trayendo."""
+        self.cancel_reason = reason
+        for token in (self.load_token, self.count_token):
+            if token is not None:
+                token.cancel()
+        if self.model is not None:
+            self.model.cancel_loads()
+
+    def update_cancel_button(self):
+        en_marcha = self.load_token is not None or self.count_token is not None
+        self.cancel_btn.setEnabled(en_marcha)
+        if not en_marcha:
+            self.timeout_timer.stop()
 
     def set_widgets_enabled(self, enabled):
         for widget in [self.sql_edit, self.table,
@@ -143,74 +516,93 @@ class FileViewerWidget(QWidget):
                        self.guide_link, self.error_label]:
             widget.setEnabled(enabled)
 
-    def getTotalRows(self):
-        # Asegura que la base de datos esté creada antes de conectar
-        #self.extractor_file.loader._ensure_db_polars(self.extractor_file)
-        db_path = self.extractor_file.loader._db_path
-        if self.total_rows == 0:
-            conn = sqlite3.connect(db_path)
-            if not self.sql_query:
-                count_query = "SELECT COUNT(*) FROM data"
-            else:
-                count_query = f"SELECT COUNT(*) FROM ({self.sql_query})"
-            try:
-                self.total_rows = conn.execute(count_query).fetchone()[0]
-            except Exception:
-                self.total_rows = 0
-            conn.close()
-
-    def run_page_query(self):
-        self.getTotalRows()
-        self.start_loading_threaded()
-
-    def on_loaded(self, df):
+    def on_loaded(self, pager, page, df):
+        if pager is not self.pager:
+            return  # Primer bloque de una consulta ya sustituida
+        self.load_token = None
         self.file_content = df
         # self.loading_label.setVisible(False)
         # self.progress_bar.setVisible(False)
         self.set_widgets_enabled(True)
-        # Si la página está vacía pero hay más registros, recalcula el total y muestra la página anterior
-        if df is not None and df.empty and self.current_page > 0:
-            self.current_page -= 1
-            self.run_page_query()
-            return
+        # Un primer bloque incompleto es todo el resultado: el total sale sin contar
+        if pager.count is None and df is not None and len(df) < self.PAGE_SIZE:
+            pager.count = len(df)
+        self.start_counting()
         self.load_data()
+        self.update_cancel_button()
 
-    def on_error(self, msg):
+    def on_error(self, pager, msg):
+        if pager is not self.pager:
+            return
+        self.load_token = None
+        self.update_cancel_button()
+        if self.model is None:
+            self.page_label.setText("Sin datos")
         # self.loading_label.setVisible(False)
         # self.progress_bar.setVisible(False)
         self.error_label.setText(f"Error al cargar: {msg}")
         self.error_label.setVisible(True)
         self.set_widgets_enabled(True)
-        # Limpia el hilo y el worker para evitar problemas en siguientes queries
-        # Solo intenta cerrar el hilo si sigue activo y no ha sido eliminado
-        try:
-            if hasattr(self, 'thread') and self.thread is not None and self.thread.isRunning():
-                self.thread.quit()
-                self.thread.wait()
-        except RuntimeError:
-            pass
-        self.thread = None
-        self.worker = None
+
+    def on_block_error(self, block, msg):
+        inicio = block * self.PAGE_SIZE
+        self.error_label.setText(f"Error al cargar las filas {inicio + 1:,}–{inicio + self.PAGE_SIZE:,}: {msg}"
+                                 .replace(",", "."))
+        self.error_label.setVisible(True)
+
+    def on_load_cancelled(self, pager):
+        if pager is not self.pager:
+            return
+        self.on_error(pager, f"Consulta {self.cancel_reason}")
+
+    def on_counted(self, pager, total):
+        if pager is not self.pager:
+            return
+        self.counting = False
+        self.count_token = None
+        self.update_cancel_button()
+        if self.model is not None:
+            self.model.set_total(total)
+            # Ya materializada, la consulta se puede anticipar sin competir con el recuento
+            self.model.prefetch_around(self.visible_rows()[0] // self.PAGE_SIZE)
+        self.update_page_controls()
+
+    def on_count_error(self, pager, msg):
+        if pager is not self.pager:
+            return
+        self.counting = False
+        self.count_note = "no se pudo contar"
+        self.count_token = None
+        self.update_cancel_button()
+        self.update_page_controls()
+
+    def on_count_cancelled(self, pager):
+        if pager is not self.pager:
+            return
+        # Se sigue pudiendo recorrer el resultado; solo falta el total
+        self.on_count_error(pager, self.cancel_reason)
+        self.count_note = f"recuento {self.cancel_reason}"
+        self.update_page_controls()
 
     def apply_sql_query(self):
         self.sql_query = self.sql_edit.text().strip()
         self.error_label.setVisible(False)
-        self.current_page = 0
-        self.total_rows = 0  # recalcula el total
         #self.loading_label.setText("Ejecutando consulta...")
         # self.loading_label.setVisible(True)
         # self.progress_bar.setVisible(True)
-        self.set_widgets_enabled(False)
-        # Limpia el hilo anterior antes de lanzar uno nuevo
-        try:
-            if hasattr(self, 'thread') and self.thread is not None and self.thread.isRunning():
-                self.thread.quit()
-                self.thread.wait()
-        except RuntimeError:
-            pass
-        self.thread = None
-        self.worker = None
-        self.run_page_query()
+        # La consulta anterior se interrumpe y sus resultados pendientes se descartan al llegar
+        self.cancel_query("sustituida por otra")
+        self.pager.close()
+        self.pager = QueryPager(self.extractor_file, self.sql_query, self.PAGE_SIZE)
+        self.counting = False
+        self.count_note = ""
+        self.load_token = self.count_token = None
+        # Fuera la tabla anterior: el resultado nuevo aún no ha llegado y puede no llegar
+        self.file_content = None
+        self.load_data()
+        self.page_label.setText("Ejecutando consulta...")
+        self.start_loading_threaded()
+        self.start_query_timeout()
 
     def show_filter_guide(self, *args):
         dlg = QDialog(self)
@@ -252,8 +644,11 @@ class FileViewerWidget(QWidget):
         <p><b>Notas:</b><br>
         La tabla principal se llama <code>data</code>.<br>
         Puedes usar cualquier consulta SQL válida de SQLite.<br>
+        Los filtros por <code>LINE_NUMBER</code> o por columnas indexadas son inmediatos: {indexadas}<br>
         </p>
-        """)
+        """.format(indexadas=', '.join(
+            f"<code>{', '.join(cols)}</code>" for cols in self.extractor_file.loader.indexes.values()
+        ) or "ninguna"))
         guide_label.setWordWrap(True)
         layout.addWidget(guide_label)
         close_btn = QPushButton("Cerrar")
@@ -262,60 +657,91 @@ class FileViewerWidget(QWidget):
         dlg.resize(700, 600)
         dlg.show()
 
+    def show_profile_dialog(self, *args):
+        """Tiempos y memoria de las consultas, bloques y recuentos del visor, como el perfil del log de los tests."""
+        dlg = QDialog(self)
+        dlg.setWindowTitle("Perfil del visor")
+        layout = QVBoxLayout(dlg)
+        text_edit = QTextEdit()
+        text_edit.setReadOnly(True)
+        text_edit.setPlainText(self.profiler.summary() or "(Sin consultas medidas)")
+        layout.addWidget(text_edit)
+        trace_btn = QPushButton("Exportar traza (Chrome)")
+        trace_btn.setEnabled(bool(self.profiler.spans))
+        trace_btn.clicked.connect(self.export_trace)
+        layout.addWidget(trace_btn)
+        close_btn = QPushButton("Cerrar")
+        close_btn.clicked.connect(dlg.close)
+        layout.addWidget(close_btn)
+        dlg.resize(600, 400)
+        dlg.show()
+
+    def export_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Exportar traza", "traza_visor.json", "Chrome trace (*.json)")
+        if path:
+            export_chrome_trace([self.profiler], path)
+
     def load_data(self):
         df = self.file_content
+        anterior = self.model
+        if anterior is not None:
+            # Deja de anticipar y libera los bloques de la consulta anterior
+            anterior.close()
+            anterior.deleteLater()
         if df is None or df.empty:
+            self.model = None
             self.table.setModel(None)
             self.page_label.setText("Sin datos")
             self.prev_btn.setEnabled(False)
             self.next_btn.setEnabled(False)
             return
 
-        self.getTotalRows()
-
-        total_pages = ((self.total_rows - 1) // self.PAGE_SIZE) + 1 if self.total_rows else 1
-
-        # Crea un modelo temporal para mostrar el DataFrame en ResultsTableWidget
-        from PySide6.QtCore import QAbstractTableModel, QModelIndex
-
-        class PandasTableModel(QAbstractTableModel):
-            def __init__(self, df, parent=None):
-                super().__init__(parent)
-                self._df = df
-
-            def rowCount(self, parent=QModelIndex()):
-                return len(self._df)
-
-            def columnCount(self, parent=QModelIndex()):
-                return len(self._df.columns)
-
-            def data(self, index, role=Qt.DisplayRole):
-                if not index.isValid():
-                    return None
-                if role == Qt.DisplayRole:
-                    value = self._df.iloc[index.row(), index.column()]
-                    return str(value)
-                return None
-
-            def headerData(self, section, orientation, role=Qt.DisplayRole):
-                if role == Qt.DisplayRole and orientation == Qt.Horizontal:
-                    return str(self._df.columns[section])
-                return None
-
-        model = PandasTableModel(df)
-        self.table.setModel(model)
-
-        self.page_label.setText(f"Página {self.current_page + 1} / {total_pages}")
-        self.prev_btn.setEnabled(self.current_page > 0)
-        self.next_btn.setEnabled(self.current_page < (total_pages - 1))
+        self.model = LazyQueryModel(self.pager, df.columns, block_columns(df), self.profiler, self)
+        self.model.rowsInserted.connect(self.update_page_controls)
+        self.model.block_failed.connect(self.on_block_error)
+        self.table.setModel(self.model)
+        self.table.table.scrollToTop()
+        # Anchos según las filas visibles, una sola vez
+        self.table.table.resizeColumnsToContents()
+        self.model.prefetch_around(0)
+        self.update_page_controls()
+
+    def visible_rows(self):
+        view = self.table.table
+        primera = max(view.rowAt(0), 0)
+        ultima = view.rowAt(view.viewport().height() - 1)
+        if ultima < 0:
+            ultima = self.model.rowCount() - 1
+        return primera, ultima
+
+    def update_page_controls(self, *args):
+        if self.model is None:
+            return
+        primera, ultima = self.visible_rows()
+        total_rows = self.pager.count
+        if total_rows is None:
+            total = f"más de {self.model.rowCount():,} ({self.count_note})"
+        else:
+            total = f"{total_rows:,}"
+        self.page_label.setText(f"Filas {primera + 1:,}–{ultima + 1:,} de {total}".replace(",", "."))
+        self.prev_btn.setEnabled(primera > 0)
+        self.next_btn.setEnabled(ultima < self.model.rowCount() - 1 or self.model.canFetchMore())
+
+    def scroll_to_row(self, row):
+        self.table.table.scrollTo(self.model.index(row, 0), QAbstractItemView.PositionAtTop)
 
     def next_page(self):
-        if (self.current_page + 1) * self.PAGE_SIZE < self.total_rows:
-            self.current_page += 1
-            self.run_page_query()
+        if self.model is None:
+            return
+        primera, _ = self.visible_rows()
+        destino = primera + self.PAGE_SIZE
+        if destino >= self.model.rowCount():
+            self.model.fetchMore()
+            destino = self.model.rowCount() - 1
+        self.scroll_to_row(destino)
 
     def prev_page(self):
-        if self.current_page > 0:
-            self.current_page -= 1
-            self.run_page_query()
-
+        if self.model is None:
+            return
+        primera, _ = self.visible_rows()
+        self.scroll_to_row(max(primera - self.PAGE_SIZE, 0))
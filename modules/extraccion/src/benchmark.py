@@ -0,0 +1,327 @@
+"""
+Benchmark de la carga de la caché, los tests y la paginación del visor sobre extractos sintéticos.
+
+Genera un fichero a partir de un structure.yaml (o de la estructura de validation_parity) con el
+número de filas y columnas, la tasa de errores, la tasa de PK duplicadas y la codificación que se
+pidan, mide cada etapa y añade el resultado a un histórico JSON comparándolo con la ejecución
+anterior con los mismos parámetros.
+
+    python -m modules.extraccion.src.benchmark --rows 1000000 --error-rate 0.01 --dup-rate 0.001
+    python -m modules.extraccion.src.benchmark --scope DataVault --version 3.5 --file SAT_CONTRATO_RENUMERACION
+
+Sale con código 1 si se indica --max-regression y alguna etapa empeora más que ese porcentaje, y
+con código 2 si un motor de validación no encuentra los mismos errores que el de referencia (sqlite):
+su tiempo no sería comparable y no se guarda nada en el histórico.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from modules.extraccion.src.File import ExtractorFile, SQLiteFileLoader, MODULE_BASE
+from modules.extraccion.src.sqlite_pool import SQLitePool
+from modules.extraccion.src.profiling import Profiler, export_chrome_trace
+from modules.extraccion.src.viewer_query import QueryPager
+from modules.extraccion.src.tests.test_formato import TestFormato
+from modules.extraccion.src.tests.test_pk import TestPK
+from modules.extraccion.src.validation_parity import ESTRUCTURA, METADATA
+
+NOMBRE_FICHERO = "BENCH"
+TAMAÑO_POOL = 997  # Valores distintos que se generan por columna y se muestrean
+PAGE_SIZE = 1000  # Igual que el visor
+
+MOTOR_REFERENCIA = 'sqlite'  # Motor con el que se comparan los errores del resto, como en validation_parity
+
+# La estructura de paridad con claves más anchas, para que solo haya las PK duplicadas que se generan
+ESTRUCTURA_BENCH = [dict(campo, size=9) if campo.get('pk') else campo for campo in ESTRUCTURA]
+
+
+def medir(profiler, nombre, func, filas, bytes_fichero):
+    # CPU de todo el proceso: polars y SQLite trabajan también en sus propios hilos
+    cpu_antes = time.process_time()
+    with profiler.span(nombre, rows=filas) as span:
+        func()
+    return {
+        "seconds": round(span.wall, 4),
+        "cpu_seconds": round(time.process_time() - cpu_antes, 4),
+        "peak_rss_mb": round(span.peak_rss / (1024 * 1024), 1),
+        "rows_per_s": round(filas / span.wall) if span.wall else None,
+        "mb_per_s": round(bytes_fichero / (1024 * 1024) / span.wall, 2) if span.wall else None,
+    }
+
+
+# --- Generación del extracto ---
+
+def ajustar_columnas(estructura, columnas):
+    """Recorta la estructura o la completa con campos VARCHAR hasta tener el número de columnas pedido."""
+    if not columnas:
+        return list(estructura)
+    estructura = list(estructura[:columnas])
+    for i in range(len(estructura), columnas):
+        estructura.append({'name': f'RELLENO_{i}', 'type': 'VARCHAR', 'size': 20})
+    return estructura
+
+
+def _pools(campo, rng):
+    """Valores válidos y erróneos de un campo según su tipo."""
+    tipo = campo['type'].upper()
+    tamaño = campo.get('size') or 20
+    if tipo == 'INTEGER':
+        validos = rng.integers(0, 10 ** min(tamaño, 18), TAMAÑO_POOL).astype(str)
+        erroneos = ['abc', 'x1', '9' * (tamaño + 1)]
+    elif tipo == 'DECIMAL':
+        precision = campo.get('precision') or 0
+        enteros = rng.integers(0, 10 ** max(min(tamaño - precision, 18), 1), TAMAÑO_POOL)
+        decimales = rng.integers(0, 10 ** precision, TAMAÑO_POOL) if precision else None
+        validos = [f"{e}.{d:0{precision}d}" if precision else str(e) for e, d in
+                   zip(enteros, decimales if precision else enteros)]
+        erroneos = ['1.' + '1' * (precision + 2), 'abc', '9' * (tamaño + 1) + '.0']
+    elif tipo == 'DATE':
+        formato = campo.get('format', TestFormato.FORMATO_FECHA)
+        fechas = pd.Timestamp('2000-01-01') + pd.to_timedelta(rng.integers(0, 365 * 30, TAMAÑO_POOL), unit='D')
+        validos = list(fechas.strftime(formato))
+        inexistente = formato.replace('%Y', '2025').replace('%m', '02').replace('%d', '30')
+        erroneos = [inexistente, 'fecha', '2024/1/1']
+    else:
+        letras = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+        longitudes = rng.integers(1, tamaño + 1, TAMAÑO_POOL)
+        validos = [''.join(rng.choice(letras, n)) for n in longitudes]
+        erroneos = ['X' * (tamaño + 1), 'Ñ' * (tamaño + 3)]
+    return np.array(validos, dtype=object), np.array(erroneos, dtype=object)
+
+
+def _columna_pk(campo, indices, divisor):
+    """Valor de una columna PK que, combinado con las demás, identifica de forma única cada índice."""
+    tipo = campo['type'].upper()
+    tamaño = min(campo.get('size') or 9, 9)
+    if tipo == 'DATE':
+        base = 365 * 30
+        formato = campo.get('format', TestFormato.FORMATO_FECHA)
+        fechas = pd.Timestamp('2000-01-01') + pd.to_timedelta((indices // divisor) % base, unit='D')
+        return np.array(fechas.strftime(formato), dtype=object), base
+    base = 10 ** tamaño
+    return ((indices // divisor) % base).astype(str).astype(object), base
+
+
+def generar_extracto(carpeta, estructura, metadata, filas, tasa_errores=0.0, tasa_duplicados=0.0, seed=0):
+    """Escribe <carpeta>/BENCH.<extensión> y devuelve su ruta."""
+    rng = np.random.default_rng(seed)
+    posiciones = np.arange(filas)
+    # Una fila duplicada copia la PK de una fila anterior al azar
+    duplicada = (rng.random(filas) < tasa_duplicados) & (posiciones > 0)
+    origen = np.where(duplicada, (rng.random(filas) * posiciones).astype(np.int64), posiciones)
+    columnas = {}
+    divisor = 1
+    for campo in estructura:
+        nombre = campo['name'].upper()
+        if campo.get('pk'):
+            columnas[nombre], base = _columna_pk(campo, origen, divisor)
+            # Cuando las columnas anteriores ya distinguen todas las filas, el resto queda constante
+            divisor = min(divisor * base, filas + 1)
+            continue
+        validos, erroneos = _pools(campo, rng)
+        valores = validos[rng.integers(0, len(validos), filas)]
+        if tasa_errores:
+            errores = rng.random(filas) < tasa_errores
+            valores[errores] = erroneos[rng.integers(0, len(erroneos), int(errores.sum()))]
+        columnas[nombre] = valores
+    ruta = os.path.join(carpeta, f"{NOMBRE_FICHERO}.{metadata['Extension']}")
+    pd.DataFrame(columnas).to_csv(
+        ruta, sep=metadata['Separator'], header=bool(metadata.get('Header', True)), index=False,
+        encoding=metadata['Encoding'], lineterminator='\n'
+    )
+    return ruta
+
+
+# --- Etapas ---
+
+class DiscrepanciaMotores(Exception):
+    """Un motor de validación encuentra errores distintos que el de referencia sobre el mismo extracto."""
+
+
+def contar_errores(test):
+    """Estado del test y número de errores por campo y tipo."""
+    errores = test.convertir_a_dict(test.errors)
+    return test.status, {campo: {tipo: len(lista) for tipo, lista in tipos.items()} for campo, tipos in errores.items()}
+
+
+def motor_usado(test):
+    """Motor con el que validó realmente el test: polars cae a SQLite con encodings que no soporta."""
+    return next((span.args["motor"] for span in test.profiler.spans if "motor" in span.args), None)
+
+
+def medir_etapas(carpeta, config_content, filas, bytes_fichero, profilers):
+    """
+    Mide cada etapa y deja en profilers los spans del benchmark y los de cada test. Antes de
+    dar por buena la medida de un test comprueba que encuentra los mismos errores que con el
+    motor de referencia; si no, lanza DiscrepanciaMotores. Si el test validó con otro motor
+    que el pedido, la etapa no se guarda.
+    """
+    etapas = {}
+    profiler = Profiler("benchmark")
+    profilers.append(profiler)
+    cache = config_content['metadata'].get('Cache', 'sqlite')
+    SQLiteFileLoader.clear_sqlite_cache(carpeta)
+    extractor_file = ExtractorFile(NOMBRE_FICHERO, '1', NOMBRE_FICHERO, carpeta, config_content=config_content)
+    # prepare sin polars construye siempre la caché SQLite; con caché arrow se mide además el IPC
+    etapas["ingest_sqlite"] = medir(profiler, "ingest_sqlite", lambda: extractor_file.loader.prepare(extractor_file),
+                                    filas, bytes_fichero)
+    if cache == 'arrow':
+        etapas["ingest_arrow"] = medir(profiler, "ingest_arrow",
+                                       lambda: extractor_file.loader.prepare(extractor_file, usar_polars=True),
+                                       filas, bytes_fichero)
+
+    for test_class in (TestFormato, TestPK):
+        referencia = None
+        for motor in (MOTOR_REFERENCIA, 'polars'):
+            test = test_class(extractor_file)
+            test.validation_backend = motor
+            test.profiler = Profiler(f"{test_class.name}_{motor}")
+            profilers.append(test.profiler)
+            medida = medir(profiler, test.profiler.name, test.run, filas, bytes_fichero)
+            usado = motor_usado(test)
+            if usado != motor:
+                # Registrarla como del motor pedido mezclaría tiempos de otro motor en el histórico
+                print(f"⚠️ {test_class.name}: se pidió el motor {motor} pero validó con {usado}, no se guarda la etapa")
+                continue
+            errores = contar_errores(test)
+            if referencia is None:
+                referencia = errores
+            elif errores != referencia:
+                raise DiscrepanciaMotores(f"{test_class.name} con motor {motor}: {errores} "
+                                          f"frente a {MOTOR_REFERENCIA}: {referencia}")
+            etapas[test.profiler.name] = medida
+
+    db_path = extractor_file.loader._db_path
+    paginas = sorted({0, filas // 2 // PAGE_SIZE, max(filas - 1, 0) // PAGE_SIZE})
+
+    def paginar():
+        pager = QueryPager(extractor_file, "", PAGE_SIZE)
+        for pagina in paginas:
+            pager.fetch_page(pagina)
+
+    etapas["viewer_page"] = medir(profiler, "viewer_page", paginar, PAGE_SIZE * len(paginas), 0)
+    etapas["viewer_page"]["seconds_per_page"] = round(etapas["viewer_page"]["seconds"] / len(paginas), 4)
+    SQLitePool.close_path(db_path)
+    return etapas
+
+
+# --- Histórico ---
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=MODULE_BASE, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(anterior, actual, max_regresion):
+    """Imprime la variación de tiempo por etapa y devuelve las etapas que empeoran más de max_regresion."""
+    regresiones = []
+    for etapa, medida in actual.items():
+        previa = (anterior or {}).get(etapa)
+        if not previa or not previa.get("seconds"):
+            print(f"{etapa:<24} {medida['seconds']:>9.3f}s  {medida['peak_rss_mb']:>8.1f} MB")
+            continue
+        cambio = (medida["seconds"] - previa["seconds"]) / previa["seconds"]
+        print(f"{etapa:<24} {medida['seconds']:>9.3f}s  {medida['peak_rss_mb']:>8.1f} MB  "
+              f"{cambio:+.1%} vs {previa['seconds']:.3f}s")
+        if max_regresion is not None and cambio > max_regresion:
+            regresiones.append(etapa)
+    return regresiones
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark de carga, tests y paginación sobre un extracto sintético.")
+    parser.add_argument("--structure", help="structure.yaml a usar")
+    parser.add_argument("--scope")
+    parser.add_argument("--version")
+    parser.add_argument("--file", help="Fichero del scope cuya estructura y metadata se usan")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--columns", type=int, default=None, help="Recorta o completa la estructura")
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--dup-rate", type=float, default=0.001)
+    parser.add_argument("--encoding", default=None, help="Codificación del extracto (por defecto la de metadata)")
+    parser.add_argument("--cache", choices=("sqlite", "arrow"), default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--history", default="benchmark_history.json")
+    parser.add_argument("--max-regression", type=float, default=None, help="p.ej. 0.2 para fallar con un 20%% más lento")
+    parser.add_argument("--keep", action="store_true", help="No borra el extracto generado")
+    parser.add_argument("--trace", help="Exporta los spans de la ejecución como Chrome trace")
+    return parser.parse_args(argv)
+
+
+def cargar_configuracion(args):
+    if args.scope and args.version and args.file:
+        config = ExtractorFile(args.scope, args.version, args.file, tempfile.gettempdir()).config_content
+        estructura, metadata = config['structure'], dict(config['metadata'])
+    elif args.structure:
+        with open(args.structure, 'r', encoding='utf-8') as f:
+            estructura = yaml.safe_load(f)
+        metadata = dict(METADATA)
+    else:
+        estructura, metadata = ESTRUCTURA_BENCH, dict(METADATA)
+    if args.encoding:
+        metadata['Encoding'] = args.encoding
+    if args.cache:
+        metadata['Cache'] = args.cache
+    return ajustar_columnas(estructura, args.columns), metadata
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    estructura, metadata = cargar_configuracion(args)
+    parametros = {
+        "structure": args.structure or (f"{args.scope}/{args.version}/{args.file}" if args.scope else "validation_parity"),
+        "rows": args.rows, "columns": len(estructura), "error_rate": args.error_rate,
+        "dup_rate": args.dup_rate, "encoding": metadata['Encoding'], "cache": metadata.get('Cache', 'sqlite'),
+        "seed": args.seed,
+    }
+    carpeta = tempfile.mkdtemp(prefix="bench_extraccion_")
+    profilers = []
+    try:
+        print(f"generando {args.rows} filas x {len(estructura)} columnas en {carpeta}")
+        ruta = generar_extracto(carpeta, estructura, metadata, args.rows, args.error_rate, args.dup_rate, args.seed)
+        etapas = medir_etapas(carpeta, {'metadata': metadata, 'structure': estructura}, args.rows,
+                              os.path.getsize(ruta), profilers)
+    except DiscrepanciaMotores as e:
+        print(f"❌ los motores no coinciden, no se guarda la medida: {e}")
+        return 2
+    finally:
+        if not args.keep:
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+    if args.trace:
+        export_chrome_trace(profilers, args.trace)
+
+    historico = []
+    if os.path.exists(args.history):
+        with open(args.history, 'r', encoding='utf-8') as f:
+            historico = json.load(f)
+    anterior = next((entrada["stages"] for entrada in reversed(historico) if entrada["params"] == parametros), None)
+    regresiones = comparar(anterior, etapas, args.max_regression)
+    historico.append({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit_actual(),
+        "params": parametros,
+        "stages": etapas,
+    })
+    with open(args.history, 'w', encoding='utf-8') as f:
+        json.dump(historico, f, ensure_ascii=False, indent=2)
+    if regresiones:
+        print(f"❌ regresión en: {', '.join(regresiones)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+import uuid
+
+import psutil
+
+
+class CacheBuildLock:
+    """
+    Lock de construcción de una caché. Dentro del proceso se serializa con un threading.Lock
+    por ruta; entre procesos con un fichero <caché>.lock que guarda el pid del dueño y una marca
+    propia. El fichero se escribe aparte y se enlaza con os.link, que falla si ya existe, así
+    que nunca hay un .lock a medio escribir. Un .lock de un proceso que ya no existe, o vacío o
+    ilegible desde hace más de stale_after segundos, se considera abandonado.
+    """
+    _locks = {}  # cache_path -> threading.Lock
+    _registry_lock = threading.Lock()
+    poll_interval = 0.2  # Segundos entre intentos mientras otro proceso construye
+    stale_after = 5  # Segundos que puede estar un .lock vacío o ilegible antes de darlo por abandonado
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.lock_path = f"{cache_path}.lock"
+        self._owner = f"{os.getpid()} {uuid.uuid4().hex}"
+        with self._registry_lock:
+            self._thread_lock = self._locks.setdefault(cache_path, threading.Lock())
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            self._acquire_file()
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            # Solo se borra si sigue siendo nuestro: no se tira el lock de otro proceso
+            if self._read(self.lock_path) == self._owner:
+                os.remove(self.lock_path)
+        except OSError:
+            pass
+        finally:
+            self._thread_lock.release()
+
+    def _acquire_file(self):
+        avisado = False
+        while True:
+            if self._try_create() and self._read(self.lock_path) == self._owner:
+                return
+            if self._take_over_stale():
+                continue
+            if not avisado:
+                print(f"esperando a que otro proceso construya {os.path.basename(self.cache_path)}")
+                avisado = True
+            time.sleep(self.poll_interval)
+
+    def _try_create(self):
+        tmp_path = f"{self.lock_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self._owner)
+        try:
+            os.link(tmp_path, self.lock_path)
+            return True
+        except FileExistsError:
+            return False
+        except OSError:
+            # Sistema de ficheros sin enlaces duros: creación exclusiva; si se lee vacío mientras
+            # se escribe, stale_after evita que otro lo dé por abandonado
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                return False
+            with os.fdopen(fd, 'w') as f:
+                f.write(self._owner)
+            return True
+        finally:
+            os.remove(tmp_path)
+
+    def _take_over_stale(self):
+        """
+        Retira un .lock abandonado. Se aparta primero con un rename, que solo uno gana, y se
+        comprueba otra vez lo apartado: si entretanto otro proceso ya había tomado el lock, se
+        devuelve a su sitio en lugar de borrarlo.
+        """
+        if not self._is_stale(self.lock_path):
+            return False
+        apartado = f"{self.lock_path}.{os.getpid()}.stale"
+        try:
+            os.replace(self.lock_path, apartado)
+        except FileNotFoundError:
+            return True  # Ya lo retiró otro: se vuelve a intentar crear
+        except OSError:
+            return False
+        try:
+            if not self._is_stale(apartado):
+                try:
+                    os.link(apartado, self.lock_path)
+                except OSError:
+                    pass
+                return False
+            return True
+        finally:
+            os.remove(apartado)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r') as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _is_stale(self, path):
+        contenido = self._read(path)
+        try:
+            pid = int(contenido.split()[0]) if contenido else 0
+        except ValueError:
+            pid = 0
+        if not pid:
+            # Vacío o ilegible: se da por vivo mientras sea reciente, por si se está escribiendo
+            try:
+                return time.time() - os.path.getmtime(path) > self.stale_after
+            except OSError:
+                return False
+        # Con el lock de hilo tomado, un .lock con nuestro pid es de una ejecución anterior
+        return pid == os.getpid() or not psutil.pid_exists(pid)
@@ -0,0 +1,89 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class Cancelled(BaseException):
+    """
+    Se lanza en los puntos de control cuando se cancela la ejecución. Hereda de BaseException,
+    como asyncio.CancelledError, para que los except Exception de tests y loaders no la traten
+    como un fallo de validación.
+    """
+
+
+class CancellationToken:
+    """
+    Token de cancelación cooperativa que comparten el controlador, los tests y el loader.
+    Además de los puntos de control explícitos (check), las conexiones SQLite vigiladas con
+    watch se interrumpen al cancelar y se bloquean dentro de la consulta mientras hay pausa.
+    Con eventos de multiprocessing el token también llega a los procesos del pool de tests.
+    """
+    PROGRESS_OPS = 10_000  # Instrucciones de la VM de SQLite entre comprobaciones
+
+    def __init__(self, cancelled_event=None, running_event=None):
+        self._cancelled = cancelled_event or threading.Event()
+        if running_event is None:
+            running_event = threading.Event()
+            running_event.set()
+        self._running = running_event
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # Despierta a quien esté en pausa para que vea la cancelación
+        self._running.set()
+        with self._lock:
+            for conn in self._connections:
+                conn.interrupt()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def check(self, pause=True):
+        """
+        Punto de control: espera mientras haya pausa y lanza Cancelled si se ha cancelado.
+        Con pause=False solo atiende la cancelación, p.ej. con el lock de construcción de una
+        caché tomado, donde una pausa dejaría esperando a todos los que la necesitan.
+        """
+        if pause:
+            self._running.wait()
+        if self.cancelled:
+            raise Cancelled()
+
+    def _progress_handler(self):
+        # Un valor distinto de 0 hace que SQLite aborte la consulta en curso
+        self._running.wait()
+        return self._cancel_handler()
+
+    def _cancel_handler(self):
+        return 1 if self.cancelled else 0
+
+    @contextmanager
+    def watch(self, conn, pause=True):
+        """Vigila la conexión mientras dura el bloque; pause=False como en check."""
+        with self._lock:
+            self._connections.add(conn)
+        handler = self._progress_handler if pause else self._cancel_handler
+        conn.set_progress_handler(handler, self.PROGRESS_OPS)
+        try:
+            yield conn
+        except sqlite3.OperationalError:
+            if self.cancelled:
+                raise Cancelled() from None
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+            with self._lock:
+                self._connections.discard(conn)
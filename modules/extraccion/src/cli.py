@@ -0,0 +1,147 @@
+"""
+Ejecución de los tests de extracción sin interfaz, para lanzarlos en servidores o en batch.
+
+    python -m modules.extraccion.src.cli DataVault 3.5 /datos/extracciones --json resultados.json
+
+Códigos de salida: 0 todo OK, 1 algún test con error, 3 solo avisos, 4 no se pudo preparar la
+ejecución (scope, versión o carpeta inexistentes o configuración ilegible), 130 abortado con
+Ctrl+C (2 lo usa argparse para argumentos incorrectos).
+"""
+import argparse
+import csv
+import json
+import os
+import signal
+import sys
+
+import yaml
+from PySide6.QtCore import QCoreApplication, QTimer
+
+from modules.extraccion.src.test_controller import TestController
+from modules.extraccion.src.tests.test_base import VALIDATION_BACKENDS
+from modules.extraccion.src.test_worker import EXECUTION_BACKENDS
+from modules.extraccion.src.profiling import export_chrome_trace
+
+EXIT_OK = 0
+EXIT_ERRORS = 1
+EXIT_WARNINGS = 3
+EXIT_SETUP = 4
+EXIT_ABORTED = 130
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Ejecuta los tests de extracción de un scope y versión.")
+    parser.add_argument("scope")
+    parser.add_argument("version")
+    parser.add_argument("input_folder", help="Carpeta con los ficheros extraídos")
+    parser.add_argument("--scopes", default="scopes", help="Carpeta de scopes (relativa a data/ o absoluta)")
+    parser.add_argument("--workers", type=int, default=None, help="Tests simultáneos (por defecto, núcleos)")
+    parser.add_argument("--backend", choices=VALIDATION_BACKENDS, default="auto", help="Motor de validación")
+    parser.add_argument("--execution", choices=EXECUTION_BACKENDS, default="threads", help="Hilos o procesos")
+    parser.add_argument("--no-resume", action="store_true", help="Ignora los resultados guardados y ejecuta todo")
+    parser.add_argument("--json", dest="json_path", help="Fichero JSON con el detalle de los resultados")
+    parser.add_argument("--csv", dest="csv_path", help="Fichero CSV con un resumen por fichero y test")
+    parser.add_argument("--trace", dest="trace_path", help="Fichero Chrome trace con los spans de la ingesta y los tests")
+    return parser.parse_args(argv)
+
+
+def collect_results(controller):
+    resultados = []
+    for file_name, row_tests in zip(controller.files, controller.test_objects):
+        for test in row_tests:
+            errors = test.convertir_a_dict(test.errors)
+            resultados.append({
+                "file": file_name,
+                "test": test.name,
+                "status": test.status,
+                "errors_count": sum(len(lista) for tipos in errors.values() for lista in tipos.values()),
+                "log": test.log,
+                "profile": test.profiler.to_dict()["spans"],
+                "errors": errors,
+            })
+    return resultados
+
+
+def write_json(path, resultados):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2, default=str)
+
+
+def write_csv(path, resultados):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(["file", "test", "status", "errors_count"])
+        for resultado in resultados:
+            writer.writerow([resultado["file"], resultado["test"], resultado["status"], resultado["errors_count"]])
+
+
+def exit_code(controller, resultados):
+    if controller.aborted:
+        return EXIT_ABORTED
+    if any(resultado["status"] == "❌ Error" for resultado in resultados):
+        return EXIT_ERRORS
+    if any(resultado["status"] == "⚠️ Warning" for resultado in resultados):
+        return EXIT_WARNINGS
+    return EXIT_OK
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    app = QCoreApplication.instance() or QCoreApplication([])
+    controller = TestController(args.scopes)
+    controller.validation_backend = args.backend
+    controller.execution_backend = args.execution
+    if args.workers:
+        controller.max_workers = args.workers
+    try:
+        if not os.path.isdir(args.input_folder):
+            raise FileNotFoundError(f"No existe la carpeta de entrada {args.input_folder}")
+        controller.build_pending_matrix(args.scope, args.version, args.input_folder, restore=not args.no_resume)
+    except (OSError, yaml.YAMLError, KeyError) as e:
+        print(f"No se pudo preparar la ejecución: {e}", file=sys.stderr)
+        return EXIT_SETUP
+
+    def on_status(row, col, status):
+        if col:
+            print(f"[{controller.tests_executed + 1}/{controller.total_tests}] "
+                  f"{controller.files[row]} · {controller.test_objects[row][col - 1].name}: {status}", file=sys.stderr)
+        # Tras abortar no se emite tests_finished: se sale cuando terminan las tareas en vuelo
+        if controller.aborted and not controller.in_flight:
+            app.quit()
+
+    controller.test_status_changed.connect(on_status)
+    controller.tests_finished.connect(app.quit)
+
+    def on_sigint(signum, frame):
+        print("Abortando...", file=sys.stderr)
+        controller.abort()
+        if not controller.in_flight:
+            app.quit()
+
+    signal.signal(signal.SIGINT, on_sigint)
+    # El bucle de Qt no devuelve el control a Python por sí solo: sin este timer no llegaría el SIGINT
+    latido = QTimer()
+    latido.timeout.connect(lambda: None)
+    latido.start(200)
+
+    QTimer.singleShot(0, controller.start_tests)
+    app.exec()
+    # El último finished se emite antes de que el hilo del test acabe: hay que esperarlo antes de salir
+    controller.thread_pool.waitForDone()
+    controller.shutdown_process_pool()
+
+    resultados = collect_results(controller)
+    if args.json_path:
+        write_json(args.json_path, resultados)
+    if args.csv_path:
+        write_csv(args.csv_path, resultados)
+    if args.trace_path:
+        tareas = controller.ingest_objects + [test for row_tests in controller.test_objects for test in row_tests]
+        export_chrome_trace([tarea.profiler for tarea in tareas], args.trace_path)
+    for resultado in resultados:
+        print(f"{resultado['status']}\t{resultado['file']}\t{resultado['test']}\t{resultado['errors_count']} errores")
+    return exit_code(controller, resultados)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+from modules.extraccion.src.tests.test_base import TestExtractor
+
+
+class IngestTask(TestExtractor):
+    """
+    Nodo de ingesta del DAG de cada fichero: construye (o reutiliza) la caché una sola vez
+    antes de que arranquen los tests del fichero, que dependen de él. También toma la huella
+    del fichero fuente con la que ResultsStore guarda los resultados de sus tests.
+    """
+    name = 'Ingesta'
+
+    def run(self):
+        # Antes de leer, como la caché: no se da por buena la huella de una copia a medio escribir
+        self.extractor_file.take_fingerprint()
+        try:
+            with self.profiler.span("ingest", cache=self.extractor_file.loader.backend) as span:
+                self.extractor_file.loader.prepare(self.extractor_file, self.usar_polars(), self.token)
+        except Exception as e:
+            # Los tests se ejecutan igualmente y cada uno informa del problema con el fichero
+            self.launch_error(f"Error en la ingesta: {e}")
+            return
+        self.launch_ok(f"🕒 Tiempo Ingesta: {span.wall:.2f} segundos\n")
@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+
+class RSSSampler:
+    """
+    Hilo compartido que muestrea la RSS del proceso mientras haya spans abiertos y actualiza
+    su pico. Arranca con el primer span y termina solo cuando no queda ninguno.
+    """
+    interval = 0.02  # Segundos entre muestras
+    _spans = set()
+    _lock = threading.Lock()
+    _thread = None
+
+    @classmethod
+    def register(cls, span):
+        with cls._lock:
+            cls._spans.add(span)
+            if cls._thread is None:
+                cls._thread = threading.Thread(target=cls._run, name="RSSSampler", daemon=True)
+                cls._thread.start()
+
+    @classmethod
+    def unregister(cls, span):
+        with cls._lock:
+            cls._spans.discard(span)
+
+    @classmethod
+    def _run(cls):
+        process = psutil.Process(os.getpid())
+        while True:
+            with cls._lock:
+                if not cls._spans:
+                    cls._thread = None
+                    return
+                spans = list(cls._spans)
+            rss = process.memory_info().rss
+            for span in spans:
+                span.peak_rss = max(span.peak_rss, rss)
+            time.sleep(cls.interval)
+
+
+class Span:
+    """Una etapa medida: tiempo de reloj, CPU del hilo, RSS al empezar y pico, y filas procesadas."""
+
+    def __init__(self, name, depth=0, rows=None, **args):
+        self.name = name
+        self.depth = depth
+        self.rows = rows
+        self.args = args
+        self.start = time.time()
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rss_start = 0
+        self.peak_rss = 0
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        span = cls.__new__(cls)
+        span.__dict__.update(data)
+        return span
+
+
+class Profiler:
+    """
+    Spans de un test (o del visor). Se anidan por hilo con span(), se resumen para el diálogo
+    de log con summary() y se exportan en formato Chrome trace (chrome://tracing, Perfetto).
+    """
+
+    def __init__(self, name=""):
+        self.name = name
+        self.spans = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, rows=None, **args):
+        depth = getattr(self._local, "depth", 0)
+        span = Span(name, depth, rows, **args)
+        span.rss_start = span.peak_rss = psutil.Process(os.getpid()).memory_info().rss
+        self._local.depth = depth + 1
+        cpu_inicio = time.thread_time()
+        inicio = time.perf_counter()
+        RSSSampler.register(span)
+        try:
+            yield span
+        finally:
+            RSSSampler.unregister(span)
+            span.wall = time.perf_counter() - inicio
+            span.cpu = time.thread_time() - cpu_inicio
+            span.peak_rss = max(span.peak_rss, psutil.Process(os.getpid()).memory_info().rss)
+            self._local.depth = depth
+            with self._lock:
+                self.spans.append(span)
+
+    def ordered(self):
+        return sorted(self.spans, key=lambda span: (span.start, span.depth))
+
+    def summary(self):
+        lineas = []
+        for span in self.ordered():
+            mb = 1024 * 1024
+            linea = (f"{'    ' * span.depth}🕒 {span.name}: {span.wall:.2f} s · CPU {span.cpu:.2f} s · "
+                     f"🧠 pico {span.peak_rss / mb:.0f} MB ({(span.peak_rss - span.rss_start) / mb:+.0f} MB)")
+            if span.rows is not None:
+                ritmo = f" ({span.rows / span.wall:,.0f} filas/s)" if span.wall else ""
+                linea += f" · {span.rows:,} filas{ritmo}"
+            lineas.append(linea.replace(",", "."))
+        return "\n".join(lineas)
+
+    def to_dict(self):
+        return {"name": self.name, "spans": [span.to_dict() for span in self.spans]}
+
+    @classmethod
+    def from_dict(cls, data):
+        profiler = cls(data.get("name", ""))
+        profiler.spans = [Span.from_dict(span) for span in data.get("spans", [])]
+        return profiler
+
+    def trace_events(self):
+        return [{
+            "name": span.name,
+            "cat": self.name,
+            "ph": "X",
+            "ts": span.start * 1_000_000,
+            "dur": span.wall * 1_000_000,
+            "pid": span.pid,
+            "tid": span.tid,
+            "args": {
+                "cpu_ms": round(span.cpu * 1000, 1),
+                "rss_start_mb": round(span.rss_start / (1024 * 1024), 1),
+                "peak_rss_mb": round(span.peak_rss / (1024 * 1024), 1),
+                "rows": span.rows,
+                **{k: str(v) for k, v in span.args.items()},
+            },
+        } for span in self.spans]
+
+
+def export_chrome_trace(profilers, path):
+    """Escribe los spans de varios profilers en un único fichero JSON de Chrome trace."""
+    eventos = [evento for profiler in profilers for evento in profiler.trace_events()]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": eventos, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
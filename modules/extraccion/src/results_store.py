@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from modules.extraccion.src.File import fingerprint_matches
+
+PENDING_STATUS = "🕓 Pendiente"
+
+
+class ResultsStore:
+    """
+    Resultados de los tests persistidos en <carpeta de entrada>/.sqlite_cache/results.sqlite,
+    por (scope, versión, fichero, test). Un resultado solo se reutiliza si la huella del fichero
+    fuente y la configuración del fichero siguen siendo las mismas con las que se obtuvo.
+    """
+    DB_NAME = "results.sqlite"
+
+    def __init__(self, input_folder):
+        db_dir = os.path.join(input_folder, ".sqlite_cache")
+        os.makedirs(db_dir, exist_ok=True)
+        self.db_path = os.path.join(db_dir, self.DB_NAME)
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    scope TEXT, version TEXT, file TEXT, test TEXT,
+                    fingerprint TEXT, config TEXT, status TEXT, log TEXT, errors TEXT, updated REAL,
+                    PRIMARY KEY (scope, version, file, test)
+                )
+            """)
+
+    @staticmethod
+    def _source_path(extractor_file):
+        extension = extractor_file.config_content['metadata']['Extension']
+        return extractor_file.find_file(extractor_file.file_path, extractor_file.file, extension)
+
+    @staticmethod
+    def _config_hash(extractor_file):
+        config = json.dumps(extractor_file.config_content, sort_keys=True, default=str)
+        return hashlib.blake2b(config.encode(), digest_size=16).hexdigest()
+
+    def save(self, test):
+        """
+        Guarda el resultado de un test terminado con la huella que tomó la ingesta de su fichero
+        (o que validó restore); sin huella, p.ej. porque no está el fichero fuente, no se guarda.
+        """
+        extractor_file = test.extractor_file
+        fingerprint = extractor_file.fingerprint
+        if fingerprint is None:
+            return
+        errors = json.dumps(test.convertir_a_dict(test.errors), default=str)
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (extractor_file.scope, extractor_file.version, extractor_file.file, test.name,
+                 json.dumps(fingerprint), self._config_hash(extractor_file),
+                 test.status, test.log, errors, time.time())
+            )
+
+    @staticmethod
+    def _current_fingerprint(stored, source_path):
+        """Huella actual del fichero si la guardada sigue describiéndolo; None si no."""
+        refrescada = []
+        if not fingerprint_matches(stored, source_path, refrescada.append):
+            return None
+        return refrescada[0] if refrescada else stored
+
+    def restore(self, tests):
+        """
+        Carga en los tests de un mismo fichero los resultados guardados que siguen vigentes.
+        Devuelve cuántos se han recuperado; el resto se queda pendiente. La huella validada queda
+        en el fichero para guardar los tests que se repitan sin volver a ingerirlo.
+        """
+        if not tests:
+            return 0
+        extractor_file = tests[0].extractor_file
+        try:
+            source_path = self._source_path(extractor_file)
+        except (FileNotFoundError, KeyError, TypeError):
+            return 0
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            rows = conn.execute(
+                "SELECT test, fingerprint, config, status, log, errors, updated FROM results "
+                "WHERE scope = ? AND version = ? AND file = ?",
+                (extractor_file.scope, extractor_file.version, extractor_file.file)
+            ).fetchall()
+        guardados = {row[0]: row[1:] for row in rows}
+        config = self._config_hash(extractor_file)
+        restaurados = 0
+        refrescados = []  # Tests cuyo fichero se copió o tocó sin cambiar: se guarda la huella actual
+        vigentes = {}  # Huella guardada -> huella actual, o None si ya no coincide; se compara una vez
+        for test in tests:
+            guardado = guardados.get(test.name)
+            if guardado is None:
+                continue
+            fingerprint, config_guardada, status, log, errors, updated = guardado
+            if config_guardada != config:
+                continue
+            if fingerprint not in vigentes:
+                vigentes[fingerprint] = self._current_fingerprint(json.loads(fingerprint), source_path)
+            actual = vigentes[fingerprint]
+            if actual is None:
+                continue
+            extractor_file.fingerprint = actual
+            if json.dumps(actual) != fingerprint:
+                refrescados.append((json.dumps(actual), test.name))
+            test.status = status
+            test.log = f"♻️ Resultado recuperado de la ejecución del {time.strftime('%d/%m/%Y %H:%M', time.localtime(updated))}\n{log}"
+            test.errors = {
+                campo: {tipo: [tuple(error) for error in lista] for tipo, lista in tipos.items()}
+                for campo, tipos in json.loads(errors).items()
+            }
+            restaurados += 1
+        if refrescados:
+            with closing(sqlite3.connect(self.db_path)) as conn, conn:
+                conn.executemany(
+                    "UPDATE results SET fingerprint = ? WHERE scope = ? AND version = ? AND file = ? AND test = ?",
+                    [(fingerprint, extractor_file.scope, extractor_file.version, extractor_file.file, name)
+                     for fingerprint, name in refrescados]
+                )
+        return restaurados
@@ -0,0 +1,83 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class SQLitePool:
+    """
+    Pool de conexiones de solo lectura por base de datos de caché, compartido por el loader,
+    los tests y el visor. Cada conexión la usa un único hilo mientras está prestada.
+    """
+    _pools = {}  # db_path -> queue.Queue de conexiones libres
+    _lock = threading.Lock()
+    max_idle = 8  # Conexiones libres que se guardan por base de datos
+    mmap_size = 1024 * 1024 * 1024  # 1 GB
+    cache_size = -65536  # 64 MB por conexión
+
+    @classmethod
+    @contextmanager
+    def connection(cls, db_path):
+        pool = cls._get_pool(db_path)
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = cls._connect(db_path)
+        try:
+            yield conn
+        finally:
+            cls._release(db_path, pool, conn)
+
+    @classmethod
+    def _get_pool(cls, db_path):
+        with cls._lock:
+            pool = cls._pools.get(db_path)
+            if pool is None:
+                pool = queue.Queue(maxsize=cls.max_idle)
+                cls._pools[db_path] = pool
+            return pool
+
+    @classmethod
+    def _release(cls, db_path, pool, conn):
+        with cls._lock:
+            vigente = cls._pools.get(db_path) is pool
+        if not vigente:
+            # El pool se cerró mientras la conexión estaba prestada
+            conn.close()
+            return
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @classmethod
+    def _connect(cls, db_path):
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size = {cls.mmap_size}")
+        conn.execute(f"PRAGMA cache_size = {cls.cache_size}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    @classmethod
+    def close_path(cls, db_path):
+        """Cierra las conexiones libres de una base de datos, p.ej. antes de reconstruirla."""
+        with cls._lock:
+            pool = cls._pools.pop(db_path, None)
+        cls._drain(pool)
+
+    @classmethod
+    def close_all(cls):
+        with cls._lock:
+            pools = list(cls._pools.values())
+            cls._pools.clear()
+        for pool in pools:
+            cls._drain(pool)
+
+    @staticmethod
+    def _drain(pool):
+        while pool is not None:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
@@ -1,7 +1,15 @@
 import os
+from collections import Counter
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import psutil
 from PySide6.QtCore import QObject, Signal, QRunnable, Slot, QThreadPool
 from modules.extraccion.src.tests import TestExtractor, get_all_tests
 from modules.extraccion.src.tests.test_base import ExtractorFile
+from modules.extraccion.src.ingest import IngestTask
+from modules.extraccion.src.cancellation import CancellationToken, Cancelled
+from modules.extraccion.src.results_store import ResultsStore, PENDING_STATUS
+from modules.extraccion.src.profiling import Profiler
+from modules.extraccion.src.test_worker import run_test_in_process, create_process_pool, create_run_events
 
 MODULE_BASE = os.path.dirname(os.path.dirname(__file__))
 
@@ -19,13 +27,64 @@ class TestRunner(QRunnable):
     @Slot()
     def run(self):
         print(f"Ejecutando test en fila {self.row}, columna {self.col}")
+        self.test.profiler = Profiler(self.test.name)
+        try:
+            self.execute()
+        except Cancelled:
+            self.test.launch_warning("Test abortado por el usuario.")
+        except Exception as e:
+            # Un test que falla sin capturarlo también termina: si no, la ejecución no acabaría nunca
+            self.test.launch_error(f"Error inesperado en el test: {e}")
+        finally:
+            print(f"Terminó test en fila {self.row}, columna {self.col} con estado {self.test.status}")
+            self.signals.finished.emit(self.row, self.col, self.test.status)
+
+    def execute(self):
         self.test.run()
-        print(f"Terminó test en fila {self.row}, columna {self.col} con estado {self.test.status}")
-        self.signals.finished.emit(self.row, self.col, self.test.status)
+
+class ProcessTestRunner(TestRunner):
+    """Envía el test a un proceso del pool; el hilo solo espera el resultado y lo copia al test."""
+    def __init__(self, test: TestExtractor, row: int, col: int, signals: TestSignals, process_pool):
+        super().__init__(test, row, col, signals)
+        self.process_pool = process_pool
+
+    poll_interval = 0.1  # Segundos entre comprobaciones del token mientras se espera al proceso
+
+    def execute(self):
+        extractor_file = self.test.extractor_file
+        try:
+            future = self.process_pool.submit(
+                run_test_in_process, extractor_file.scope, extractor_file.version, extractor_file.file,
+                extractor_file.file_path, type(self.test).__name__, self.test.validation_backend,
+                extractor_file.config_content)
+            while True:
+                try:
+                    (self.test.status, self.test.log, self.test.errors, perfil,
+                     fingerprint) = future.result(timeout=self.poll_interval)
+                    self.test.profiler = Profiler.from_dict(perfil)
+                    if fingerprint is not None:
+                        extractor_file.fingerprint = fingerprint
+                    return
+                except FutureTimeoutError:
+                    # El proceso ve la cancelación por los eventos del pool; aquí se deja de esperar
+                    if self.test.token.cancelled:
+                        future.cancel()
+                        raise Cancelled()
+        except Exception as e:
+            self.test.launch_error(f"Error en el proceso de validación: {e}")
 
 class TestController(QObject):
-    test_status_changed = Signal(int, int, str)
+    """
+    Planifica los tests como un DAG por fichero: la ingesta (columna 0) va primero y los tests
+    del fichero entran en la cola en cuanto termina, solapándose con la ingesta de otros ficheros.
+    Los ficheros se encolan de mayor a menor tamaño y uno nuevo solo se admite si su huella de
+    memoria estimada cabe en el presupuesto junto a los que ya están en vuelo.
+    """
+    FOOTPRINT_FACTOR = 1.5  # Memoria estimada de un fichero en vuelo respecto a su tamaño en disco
+
+    test_status_changed = Signal(int, int, str)  # row, col, status; col 0 es la ingesta del fichero
     test_progress = Signal(int, int)
+    ingest_progress = Signal(int, int)
     tests_finished = Signal()
 
     def __init__(self, scopes_base_path, parent=None):
@@ -36,13 +95,31 @@ class TestController(QObject):
         self.test_classes = get_all_tests()
         self.files = []
         self.test_objects = []
+        self.ingest_objects = []
+        self.results_store = None
         self.thread_pool = QThreadPool()
         self.test_queue = []
+        self.blocked = {}  # row -> tests que esperan a la ingesta de su fichero
+        self.ingests_executed = 0
         self.tests_executed = 0
+        self.total_ingests = 0
         self.total_tests = 0
         self.paused = False
         self.aborted = False
         self.running = False
+        self.validation_backend = "auto"  # Motor de validación de la ejecución, ver VALIDATION_BACKENDS
+        self.max_workers = os.cpu_count() or 1  # Tests simultáneos
+        self.memory_budget = 0.75  # Fracción de la RAM total que puede ocupar el proceso
+        self.in_flight = 0
+        self.token = CancellationToken()  # Token de la ejecución en curso, compartido por todas sus tareas
+        self.rows_in_flight = Counter()  # row -> tareas del fichero en ejecución
+        self.tasks_in_flight = set()  # (row, col) en ejecución
+        self.reruns = set()  # (row, col) en ejecución que se han vuelto a pedir: se encolan al terminar
+        self.file_sizes = {}  # row -> tamaño del fichero fuente
+        self.execution_backend = "threads"  # Ver EXECUTION_BACKENDS
+        self.process_pool = None
+        self._process_pool_workers = 0
+        self._run_events = None  # Eventos del token compartidos con los procesos del pool
 
     def load_scopes(self):
         return [name for name in os.listdir(self.scopes_base_path)
@@ -60,14 +137,24 @@ class TestController(QObject):
         return [name for name in os.listdir(scope_path)
                 if os.path.isdir(os.path.join(scope_path, name))]
 
-    def build_pending_matrix(self, scope_name, version_name, input_folder):
+    def build_pending_matrix(self, scope_name, version_name, input_folder, restore=True):
+        """
+        Crea los tests de cada fichero. Con restore, los que tienen un resultado guardado para
+        la misma huella de fichero y configuración lo muestran ya y no se vuelven a encolar.
+        """
         scope_path = os.path.join(self.scopes_base_path, scope_name, version_name)
         self.files = self.get_expected_file_names(scope_path)
         self.test_objects = []
+        self.ingest_objects = []
+        self.results_store = ResultsStore(input_folder) if input_folder else None
         for file_name in self.files:
-            extractor_file = ExtractorFile(scope_name, version_name, file_name, input_folder)
+            extractor_file = ExtractorFile(scope_name, version_name, file_name, input_folder,
+                                           scopes_path=self.scopes_base_path)
             row_tests = [cls(extractor_file) for cls in self.test_classes]
+            if restore and self.results_store is not None:
+                self.results_store.restore(row_tests)
             self.test_objects.append(row_tests)
+            self.ingest_objects.append(IngestTask(extractor_file))
         return self.files, self.test_objects
 
     def start_tests(self):
@@ -76,44 +163,182 @@ class TestController(QObject):
         self.paused = False
         self.aborted = False
         self.running = True
+        self.token = self.new_token()
         self.test_queue.clear()
-        for row_index, row_tests in enumerate(self.test_objects):
-            for col_offset, test in enumerate(row_tests, start=1):
-                self.test_queue.append((test, row_index, col_offset))
-        self.total_tests = len(self.test_queue)
+        self.blocked.clear()
+        self.reruns.clear()
+        self.file_sizes = {row: ingest.extractor_file.source_size()
+                           for row, ingest in enumerate(self.ingest_objects)}
+        # Longest processing time first: el fichero más grande no se queda para el final
+        for row_index in sorted(self.file_sizes, key=self.file_sizes.get, reverse=True):
+            # Solo ficheros con algún test sin resultado recuperado
+            if any(test.status == PENDING_STATUS for test in self.test_objects[row_index]):
+                self.enqueue_row(row_index, only_pending=True)
+        self.total_ingests = len(self.blocked)
+        self.total_tests = sum(len(tests) for tests in self.blocked.values())
         self.tests_executed = 0
+        self.ingests_executed = 0
         self.run_next_test()
 
+    def is_scheduled(self, row, col):
+        """Indica si la tarea ya está en cola, esperando a la ingesta de su fichero o en ejecución."""
+        return ((row, col) in self.tasks_in_flight
+                or any((r, c) == (row, col) for _, r, c in self.test_queue)
+                or any(c == col for _, _, c in self.blocked.get(row, [])))
+
+    def enqueue_row(self, row_index, only_pending=False):
+        """
+        Encola la ingesta del fichero y deja sus tests bloqueados hasta que termine. Si la ingesta
+        ya está en cola o en ejecución no se repite: los tests esperan a esa. Devuelve las
+        (ingestas, tests) que se han añadido.
+        """
+        ingestas = 0
+        if not self.is_scheduled(row_index, 0):
+            ingest = self.ingest_objects[row_index]
+            ingest.status = PENDING_STATUS
+            ingest.log = ""
+            ingest.validation_backend = self.validation_backend
+            ingest.token = self.token
+            self.test_queue.append((ingest, row_index, 0))
+            ingestas = 1
+        bloqueados = self.blocked.setdefault(row_index, [])
+        tests = 0
+        for col_offset, test in enumerate(self.test_objects[row_index], start=1):
+            if only_pending and test.status != PENDING_STATUS:
+                continue
+            if (row_index, col_offset) in self.tasks_in_flight:
+                # En ejecución sobre la caché anterior: se repite cuando termine
+                self.reruns.add((row_index, col_offset))
+                continue
+            if self.is_scheduled(row_index, col_offset):
+                continue
+            test.status = PENDING_STATUS
+            test.validation_backend = self.validation_backend
+            test.token = self.token
+            bloqueados.append((test, row_index, col_offset))
+            tests += 1
+        return ingestas, tests
+
     def run_next_test(self):
+        """Arranca tests de la cola hasta tener max_workers en vuelo o agotar el presupuesto de memoria."""
         if self.aborted or self.paused:
             return
-        if not self.test_queue:
+        if not self.test_queue and not self.in_flight:
             self.running = False
             self.tests_finished.emit()
             return
-        test, row, col = self.test_queue.pop(0)
-        signals = TestSignals()
-        signals.finished.connect(self.on_test_finished)
-        runner = TestRunner(test, row, col, signals)
-        self.thread_pool.start(runner)
+        self.thread_pool.setMaxThreadCount(max(1, self.max_workers))
+        while self.test_queue and self.in_flight < self.max_workers:
+            # Siempre se admite un test si no hay ninguno en vuelo, aunque se supere el presupuesto
+            if self.in_flight and not self.memory_available():
+                break
+            index = self.next_admissible()
+            if index is None:
+                break
+            test, row, col = self.test_queue.pop(index)
+            self.tasks_in_flight.add((row, col))
+            signals = TestSignals()
+            signals.finished.connect(self.on_test_finished)
+            if self.execution_backend == "processes":
+                runner = ProcessTestRunner(test, row, col, signals, self.get_process_pool())
+            else:
+                runner = TestRunner(test, row, col, signals)
+            self.in_flight += 1
+            self.rows_in_flight[row] += 1
+            self.running = True
+            self.thread_pool.start(runner)
+
+    def estimated_footprint(self, row):
+        return self.file_sizes.get(row, 0) * self.FOOTPRINT_FACTOR
+
+    def next_admissible(self):
+        """Posición de la primera tarea cuyo fichero ya está en vuelo o cabe en el presupuesto de memoria."""
+        if not self.rows_in_flight:
+            return 0
+        budget = psutil.virtual_memory().total * self.memory_budget
+        used = sum(self.estimated_footprint(row) for row in self.rows_in_flight)
+        for index, (_, row, _) in enumerate(self.test_queue):
+            if row in self.rows_in_flight or used + self.estimated_footprint(row) <= budget:
+                return index
+        return None
+
+    def memory_available(self):
+        process = psutil.Process(os.getpid())
+        rss = process.memory_info().rss
+        # Con el backend de procesos la memoria está en los hijos
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss < psutil.virtual_memory().total * self.memory_budget
+
+    def new_token(self):
+        """Token de una ejecución; con procesos, sobre eventos que también ven los del pool."""
+        if self.execution_backend != "processes":
+            return CancellationToken()
+        if self._run_events is None or self._run_events[0].is_set():
+            # Tras cancelar, los procesos que aún acaban su test siguen viendo la cancelación:
+            # la nueva ejecución usa eventos y procesos nuevos
+            self.shutdown_process_pool()
+            self._run_events = create_run_events()
+        self._run_events[1].set()
+        return CancellationToken(*self._run_events)
+
+    def get_process_pool(self):
+        if self.process_pool is None or self._process_pool_workers != self.max_workers:
+            self.shutdown_process_pool()
+            if self._run_events is None:
+                self._run_events = create_run_events()
+            self.process_pool = create_process_pool(self.max_workers, self._run_events)
+            self._process_pool_workers = self.max_workers
+        return self.process_pool
+
+    def shutdown_process_pool(self):
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+            self.process_pool = None
 
     def on_test_finished(self, row, col, status):
+        self.in_flight -= 1
+        self.rows_in_flight[row] -= 1
+        if not self.rows_in_flight[row]:
+            del self.rows_in_flight[row]
+        self.tasks_in_flight.discard((row, col))
         self.test_status_changed.emit(row, col, status)
-        self.tests_executed += 1
-        self.test_progress.emit(self.tests_executed, self.total_tests)
+        if col == 0:
+            # Ingesta terminada: los tests del fichero pasan delante del resto de la cola
+            self.ingests_executed += 1
+            self.ingest_progress.emit(self.ingests_executed, self.total_ingests)
+            if not self.aborted:
+                self.test_queue[:0] = self.blocked.pop(row, [])
+        else:
+            if self.results_store is not None and not self.token.cancelled:
+                self.results_store.save(self.test_objects[row][col - 1])
+            self.tests_executed += 1
+            self.test_progress.emit(self.tests_executed, self.total_tests)
+            if (row, col) in self.reruns and not self.aborted:
+                self.reruns.discard((row, col))
+                self.reenqueue_test(self.test_objects[row][col - 1], row, col)
         self.run_next_test()
 
     def pause(self):
+        # Además de no arrancar tareas nuevas, las que están en vuelo se detienen en su siguiente punto de control
         self.paused = True
+        self.token.pause()
 
     def resume(self):
         if self.paused:
             self.paused = False
+            self.token.resume()
             self.run_next_test()
 
     def abort(self):
         self.aborted = True
+        self.token.cancel()
         self.test_queue.clear()
+        self.blocked.clear()
+        self.reruns.clear()
         self.running = False
         if self.files and self.files[0]:
             input_folder = self.test_objects[0][0].extractor_file.file_path
@@ -123,15 +348,29 @@ class TestController(QObject):
         self.running = False
 
     def reenqueue_test(self, test, row, col):
-        test.status = "🕓 Pendiente"
+        if (row, col) in self.tasks_in_flight:
+            # Dos ejecuciones a la vez del mismo test pisarían su estado: se repite al terminar
+            self.reruns.add((row, col))
+            return
+        if self.is_scheduled(row, col):
+            return
+        test.status = PENDING_STATUS
         test.log = ""
-        self.test_queue.append((test, row, col))
-        if not self.running:
-            self.run_next_test()
+        test.validation_backend = self.validation_backend
+        test.token = self.token
+        if row in self.blocked:
+            self.blocked[row].append((test, row, col))
+        else:
+            self.test_queue.append((test, row, col))
+        self.total_tests += 1
+        self.test_progress.emit(self.tests_executed, self.total_tests)
+        self.run_next_test()
 
     def reenqueue_row(self, row_index):
-        for col_offset, test in enumerate(self.test_objects[row_index], start=1):
-            test.status = "🕓 Pendiente"
-            self.test_queue.append((test, row_index, col_offset))
-        if not self.running:
-            self.run_next_test()
+        # La ingesta se repite: si el fichero fuente cambió, se reconstruye la caché
+        ingestas, tests = self.enqueue_row(row_index)
+        self.total_ingests += ingestas
+        self.total_tests += tests
+        self.test_progress.emit(self.tests_executed, self.total_tests)
+        self.ingest_progress.emit(self.ingests_executed, self.total_ingests)
+        self.run_next_test()
@@ -0,0 +1,53 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from modules.extraccion.src.tests import get_all_tests
+from modules.extraccion.src.File import ExtractorFile
+from modules.extraccion.src.ingest import IngestTask
+from modules.extraccion.src.cancellation import CancellationToken
+
+# Backends de ejecución de los tests: hilos del proceso de la interfaz o procesos independientes
+EXECUTION_BACKENDS = ("threads", "processes")
+
+
+# spawn: los procesos no heredan el estado de Qt ni los hilos del proceso padre
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+_run_events = None  # (cancelado, en marcha) de la ejecución, en cada proceso del pool
+
+
+def create_run_events():
+    """Eventos de cancelación y pausa de una ejecución, para CancellationToken y el pool."""
+    cancelled, running = _MP_CONTEXT.Event(), _MP_CONTEXT.Event()
+    running.set()
+    return cancelled, running
+
+
+def create_process_pool(max_workers, run_events):
+    # Los eventos solo se pueden pasar al crear los procesos: llegan por el initializer
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=_MP_CONTEXT,
+                               initializer=_init_worker, initargs=run_events)
+
+
+def _init_worker(cancelled, running):
+    global _run_events
+    _run_events = (cancelled, running)
+
+
+def run_test_in_process(scope, version, file, input_folder, test_class_name, validation_backend,
+                        config_content=None):
+    """
+    Ejecuta un test (o la ingesta) en un proceso del pool contra la caché compartida del fichero
+    y devuelve solo lo que necesita la interfaz: (status, log, errors, spans, huella del fichero) con
+    errors como dict simple; la huella solo la toma la ingesta.
+    """
+    test_class = next(cls for cls in get_all_tests() + [IngestTask] if cls.__name__ == test_class_name)
+    extractor_file = ExtractorFile(scope, version, file, input_folder, config_content=config_content)
+    test = test_class(extractor_file)
+    test.validation_backend = validation_backend
+    # Cancelar o pausar la ejecución en la interfaz llega a los puntos de control del proceso
+    if _run_events is not None:
+        test.token = CancellationToken(*_run_events)
+    test.run()
+    return (test.status, test.log, test.convertir_a_dict(test.errors), test.profiler.to_dict(),
+            extractor_file.fingerprint)
@@ -2,6 +2,8 @@ from collections import defaultdict
 import gc
 
 from modules.extraccion.src.File import ExtractorFile
+from modules.extraccion.src.cancellation import CancellationToken
+from modules.extraccion.src.profiling import Profiler
 
 
 class EmptyConfig(Exception):
@@ -10,12 +12,19 @@ class EmptyFile(Exception):
     pass
 
 
+# Motores de validación: "auto" usa polars si la caché es columnar y SQLite en otro caso
+VALIDATION_BACKENDS = ("auto", "sqlite", "polars")
+
+
 class TestExtractor:
     def __init__(self, extractor_file: ExtractorFile):
         self.extractor_file = extractor_file
         self.status = "🕓 Pendiente"
         self.log = ""
         self.errors = {}
+        self.validation_backend = "auto"
+        self.token = CancellationToken()  # El controlador asigna el de la ejecución
+        self.profiler = Profiler(getattr(self, "name", type(self).__name__))
 
     def run(self):
         raise NotImplementedError("Debes implementar run()")
@@ -27,6 +36,11 @@ class TestExtractor:
             self.extractor_file.unload_file_content()
         gc.collect()
 
+    def usar_polars(self):
+        if self.validation_backend == "auto":
+            return self.extractor_file.loader.backend == "arrow"
+        return self.validation_backend == "polars"
+
     def launch_ok(self, log):
         self.status = "✔️ OK"
         self.log = log
@@ -1,18 +1,22 @@
 import os
 import re
-import sqlite3
-import psutil
 from collections import defaultdict
 from PySide6.QtCore import QThread
 
 import pandas as pd
+import polars as pl
 
 from modules.extraccion.src.tests import TestExtractor
 from modules.extraccion.src.tests.test_base import EmptyConfig, EmptyFile
+from modules.extraccion.src.File import UnsupportedEncoding
+from modules.extraccion.src.sqlite_pool import SQLitePool
 
 
 class TestFormato(TestExtractor):
     name = 'Formato'
+    MAX_REGLAS_POR_CONSULTA = 200
+    LOTE_COLUMNAR = 100_000  # Filas por lote en las reglas que se evalúan con polars sobre SQLite
+    FORMATO_FECHA = '%Y-%m-%d'  # Por defecto si el campo DATE no define 'format'
 
     def __init__(self, extractor_file):
         super().__init__(extractor_file)
@@ -24,23 +28,23 @@ class TestFormato(TestExtractor):
             self.launch_warning("Test abortado por el usuario.")
             return
         try:
-            import time
-            start_validation = time.time()
-            import psutil
-            process = psutil.Process(os.getpid())
-            mem_before = process.memory_info().rss
-            file_size = os.path.getsize(self.extractor_file.find_file(
-                self.extractor_file.file_path,
-                self.extractor_file.file,
-                self.extractor_file.config_content['metadata']['Extension']
-            ))
-            self.is_big_file = file_size > 100 * 1024 * 1024
-            validaciones = self.validar_sqlite()
-            mem_after = process.memory_info().rss
-            end_validation = time.time()
-            mem_mb = (mem_after - mem_before) / (1024 * 1024)
-            self.log += (f"🕒 Tiempo Validacion: {end_validation - start_validation:.2f} segundos\n")
-            self.log += (f"🧠 Memoria consumida en validación: {mem_mb:.2f} MB\n")
+            with self.profiler.span("validacion_formato") as span:
+                file_size = os.path.getsize(self.extractor_file.find_file(
+                    self.extractor_file.file_path,
+                    self.extractor_file.file,
+                    self.extractor_file.config_content['metadata']['Extension']
+                ))
+                self.is_big_file = file_size > 100 * 1024 * 1024
+                validaciones = None
+                if self.usar_polars():
+                    try:
+                        validaciones = self.validar_polars()
+                        span.args["motor"] = "polars"
+                    except UnsupportedEncoding as e:
+                        self.log += f"Motor polars no disponible ({e}), se valida con SQLite\n"
+                if validaciones is None:
+                    validaciones = self.validar_sqlite()
+                    span.args["motor"] = "sqlite"
             if len(validaciones) == 0:
                 self.launch_ok('Todo OK!')
             else:
@@ -59,93 +63,174 @@ class TestFormato(TestExtractor):
 
     def abort(self):
         self._abort = True
+        self.token.cancel()
 
-    def validar_sqlite(self):
+    def compilar_reglas(self):
+        """
+        Traduce la estructura a una lista de reglas (campo, tipo de error, condición SQL, expresión polars).
+        Las reglas sin condición SQL se evalúan con polars por lotes de columna; las que no tienen
+        ninguna de las dos son errores de configuración que aplican a todas las líneas.
+        """
         estructura = self.extractor_file.config_content['structure']
-        errores_por_campo = defaultdict(lambda: defaultdict(list))
-        self.extractor_file.loader._ensure_db_polars(self.extractor_file)
-        db_path = self.extractor_file.loader._db_path
-        conn = sqlite3.connect(db_path)
-        table_name = "data"
+        reglas = []
         for campo in estructura:
-            if getattr(self, "_abort", False):
-                print("Abortando validación en campo:", campo['name'])
-                break
             nombre = campo['name'].upper()
-            print(f'validando campo: {nombre}')
             tipo = campo['type'].upper()
             tamaño = campo.get('size')
             precision = campo.get('precision', 0)
+            col = f'"{nombre}"'
+            valor = pl.col(nombre)
             if tipo == 'VARCHAR' and tamaño:
-                query = f"""
-                    SELECT LINE_NUMBER, "{nombre}"
-                    FROM {table_name}
-                    WHERE LENGTH("{nombre}") > {tamaño}
-                """
-                for row in conn.execute(query):
-                    if getattr(self, "_abort", False):
-                        print("Abortando validación durante query VARCHAR:", nombre)
-                        break
-                    errores_por_campo[nombre]["Longitud mayor que tamaño permitido"].append((row[0], row[1]))
+                reglas.append((nombre, "Longitud mayor que tamaño permitido",
+                               f"LENGTH({col}) > {tamaño}",
+                               valor.str.len_chars() > tamaño))
             elif tipo == 'INTEGER':
-                query = f"""
-                    SELECT LINE_NUMBER, "{nombre}"
-                    FROM {table_name}
-                    WHERE NOT ("{nombre}" GLOB '-[0-9]*' OR "{nombre}" GLOB '[0-9]*')
-                """
-                for row in conn.execute(query):
-                    if getattr(self, "_abort", False):
-                        print("Abortando validación durante query INTEGER:", nombre)
-                        break
-                    errores_por_campo[nombre]["Valor no numérico"].append((row[0], row[1]))
+                reglas.append((nombre, "Valor no numérico",
+                               f"NOT ({col} GLOB '-[0-9]*' OR {col} GLOB '[0-9]*')",
+                               ~valor.str.contains(r'^-?[0-9]')))
                 if tamaño:
-                    query = f"""
-                        SELECT LINE_NUMBER, "{nombre}"
-                        FROM {table_name}
-                        WHERE LENGTH(REPLACE("{nombre}", '-', '')) > {tamaño}
-                    """
-                    for row in conn.execute(query):
-                        if getattr(self, "_abort", False):
-                            print("Abortando validación durante query INTEGER tamaño:", nombre)
-                            break
-                        errores_por_campo[nombre]["Longitud mayor que tamaño permitido"].append((row[0], row[1]))
+                    reglas.append((nombre, "Longitud mayor que tamaño permitido",
+                                   f"LENGTH(REPLACE({col}, '-', '')) > {tamaño}",
+                                   valor.str.replace_all('-', '', literal=True).str.len_chars() > tamaño))
             elif tipo == 'DECIMAL':
                 if tamaño is None or precision is None:
-                    errores_por_campo[nombre]["Falta tamaño o precisión"].append(("TODAS", None))
+                    reglas.append((nombre, "Falta tamaño o precisión", None, None))
                     continue
                 enteros = tamaño - precision
-                query = f"""
-                    SELECT LINE_NUMBER, "{nombre}"
-                    FROM {table_name}
-                    WHERE NOT ("{nombre}" GLOB '-[0-9]*.[0-9]*' OR "{nombre}" GLOB '[0-9]*.[0-9]*' OR "{nombre}" GLOB '-[0-9]*' OR "{nombre}" GLOB '[0-9]*')
-                """
-                for row in conn.execute(query):
-                    if getattr(self, "_abort", False):
-                        print("Abortando validación durante query DECIMAL:", nombre)
-                        break
-                    errores_por_campo[nombre]["Valor no decimal"].append((row[0], row[1]))
-                # Exceso de dígitos enteros
-                query = f"""
-                    SELECT LINE_NUMBER, "{nombre}"
-                    FROM {table_name}
-                    WHERE LENGTH(SUBSTR("{nombre}", 1, INSTR("{nombre}", '.')-1)) > {enteros}
-                """
-                for row in conn.execute(query):
-                    if getattr(self, "_abort", False):
-                        print("Abortando validación durante query DECIMAL enteros:", nombre)
-                        break
-                    errores_por_campo[nombre]["Exceso de dígitos enteros"].append((row[0], row[1]))
-                # Exceso de decimales
-                query = f"""
-                    SELECT LINE_NUMBER, "{nombre}"
-                    FROM {table_name}
-                    WHERE LENGTH(SUBSTR("{nombre}", INSTR("{nombre}", '.')+1)) > {precision}
-                """
+                reglas.append((nombre, "Valor no decimal",
+                               f"NOT ({col} GLOB '-[0-9]*.[0-9]*' OR {col} GLOB '[0-9]*.[0-9]*' "
+                               f"OR {col} GLOB '-[0-9]*' OR {col} GLOB '[0-9]*')",
+                               ~valor.str.contains(r'^-?[0-9]')))
+                # Igual que SUBSTR/INSTR en SQLite: sin punto no hay parte entera que medir
+                # y la parte decimal es el valor completo
+                reglas.append((nombre, "Exceso de dígitos enteros",
+                               f"LENGTH(SUBSTR({col}, 1, INSTR({col}, '.')-1)) > {enteros}",
+                               valor.str.extract(r'^([^.]*)\.', 1).str.len_chars().fill_null(0) > enteros))
+                reglas.append((nombre, "Exceso de decimales",
+                               f"LENGTH(SUBSTR({col}, INSTR({col}, '.')+1)) > {precision}",
+                               valor.str.replace(r'^[^.]*\.', '').str.len_chars() > precision))
+            elif tipo == 'DATE':
+                formato = campo.get('format', self.FORMATO_FECHA)
+                patron = f"^{self._regex_fecha(formato)}$"
+                dtype = pl.Datetime if any(x in formato for x in ('%H', '%M', '%S')) else pl.Date
+                reglas.append((nombre, "Formato de fecha inválido", None, ~valor.str.contains(patron)))
+                # Con el formato correcto, strptime no estricto devuelve nulo si la fecha no existe (2025-02-30)
+                reglas.append((nombre, "Fecha inexistente", None,
+                               valor.str.contains(patron) & valor.str.strptime(dtype, formato, strict=False).is_null()))
+            # ...otros tipos...
+        return reglas
+
+    @staticmethod
+    def _regex_fecha(formato):
+        """Expresión regular equivalente a un formato strftime con campos numéricos de ancho fijo."""
+        anchos = {'Y': 4, 'm': 2, 'd': 2, 'y': 2, 'H': 2, 'M': 2, 'S': 2}
+        partes = re.split(r'(%[A-Za-z])', formato)
+        return ''.join(
+            f"[0-9]{{{anchos[parte[1]]}}}" if parte.startswith('%') and parte[1] in anchos else re.escape(parte)
+            for parte in partes
+        )
+
+    def _volcar_errores(self, reglas, hallazgos):
+        """Construye errores_por_campo en el orden de las reglas, como hacía la validación campo a campo."""
+        errores_por_campo = defaultdict(lambda: defaultdict(list))
+        for i, (nombre, tipo_error, condicion, expresion) in enumerate(reglas):
+            if condicion is None and expresion is None:
+                errores_por_campo[nombre][tipo_error].append(("TODAS", None))
+            elif hallazgos.get(i):
+                errores_por_campo[nombre][tipo_error].extend(hallazgos[i])
+        return self.convertir_a_dict(errores_por_campo)
+
+    def validar_sqlite(self):
+        """
+        Evalúa todas las reglas en una sola pasada: una SELECT con un flag por regla que solo devuelve
+        las filas con algún fallo. Por encima de MAX_REGLAS_POR_CONSULTA reglas se parte en varias
+        consultas para no superar los límites de profundidad de expresión de SQLite.
+        """
+        reglas = self.compilar_reglas()
+        self.extractor_file.loader._ensure_db_polars(self.extractor_file, self.token)
+        db_path = self.extractor_file.loader._db_path
+        with SQLitePool.connection(db_path) as conn, self.token.watch(conn):
+            self.total_filas = conn.execute("SELECT MAX(LINE_NUMBER) FROM data").fetchone()[0] or 0
+            hallazgos = self._validar_plan(conn, reglas)
+        return self._volcar_errores(reglas, hallazgos)
+
+    def _validar_plan(self, conn, reglas):
+        table_name = "data"
+        evaluables = [i for i, regla in enumerate(reglas) if regla[2] is not None]
+        hallazgos = defaultdict(list)
+        for inicio in range(0, len(evaluables), self.MAX_REGLAS_POR_CONSULTA):
+            lote = evaluables[inicio:inicio + self.MAX_REGLAS_POR_CONSULTA]
+            columnas = list(dict.fromkeys(reglas[i][0] for i in lote))
+            posicion = {nombre: 1 + j for j, nombre in enumerate(columnas)}
+            flags = ', '.join(f"({reglas[i][2]})" for i in lote)
+            where = ' OR '.join(f"({reglas[i][2]})" for i in lote)
+            cols = ', '.join(f'"{nombre}"' for nombre in columnas)
+            query = f"SELECT LINE_NUMBER, {cols}, {flags} FROM {table_name} WHERE {where}"
+            print(f'validando {len(lote)} reglas sobre {len(columnas)} campos')
+            offset = 1 + len(columnas)
+            with self.profiler.span("reglas_sql", rows=self.total_filas, reglas=len(lote), campos=', '.join(columnas)):
                 for row in conn.execute(query):
                     if getattr(self, "_abort", False):
-                        print("Abortando validación durante query DECIMAL decimales:", nombre)
+                        print("Abortando validación de formato")
                         break
-                    errores_por_campo[nombre]["Exceso de decimales"].append((row[0], row[1]))
-            # ...otros tipos...
-        conn.close()
-        return self.convertir_a_dict(errores_por_campo)
\ No newline at end of file
+                    for j, i in enumerate(lote):
+                        if row[offset + j]:
+                            hallazgos[i].append((row[0], row[posicion[reglas[i][0]]]))
+            if getattr(self, "_abort", False):
+                break
+        if not getattr(self, "_abort", False):
+            self._validar_por_lotes(conn, reglas, hallazgos)
+        return hallazgos
+
+    def _validar_por_lotes(self, conn, reglas, hallazgos):
+        """
+        Reglas sin traducción a SQL (fechas): se recorren las columnas implicadas en una sola
+        consulta y cada lote de LOTE_COLUMNAR filas se evalúa vectorizado con polars.
+        """
+        por_lotes = [i for i, regla in enumerate(reglas) if regla[2] is None and regla[3] is not None]
+        if not por_lotes:
+            return
+        columnas = list(dict.fromkeys(reglas[i][0] for i in por_lotes))
+        schema = {"LINE_NUMBER": pl.Int64, **{nombre: pl.Utf8 for nombre in columnas}}
+        cols = ', '.join(f'"{nombre}"' for nombre in columnas)
+        cursor = conn.execute(f"SELECT LINE_NUMBER, {cols} FROM data")
+        flags = [reglas[i][3].fill_null(False).alias(f"__regla_{i}") for i in por_lotes]
+        with self.profiler.span("reglas_por_lotes", rows=0, reglas=len(por_lotes), campos=', '.join(columnas)) as span:
+            while not getattr(self, "_abort", False):
+                self.token.check()
+                filas = cursor.fetchmany(self.LOTE_COLUMNAR)
+                if not filas:
+                    break
+                span.rows += len(filas)
+                lote = pl.DataFrame(filas, schema=schema, orient="row").with_columns(flags)
+                for i in por_lotes:
+                    fallos = lote.filter(pl.col(f"__regla_{i}")).select(["LINE_NUMBER", reglas[i][0]]).rows()
+                    hallazgos[i].extend(fallos)
+
+    def validar_polars(self):
+        """
+        Mismas reglas que validar_sqlite evaluadas como expresiones polars vectorizadas, sobre la
+        caché columnar o directamente sobre el fichero fuente. Se leen solo LINE_NUMBER y las
+        columnas con reglas.
+        """
+        reglas = self.compilar_reglas()
+        evaluables = [i for i, regla in enumerate(reglas) if regla[3] is not None]
+        hallazgos = {}
+        if evaluables and not getattr(self, "_abort", False):
+            self.token.check()
+            columnas = list(dict.fromkeys(reglas[i][0] for i in evaluables))
+            flags = [f"__regla_{i}" for i in evaluables]
+            with self.profiler.span("reglas_polars", reglas=len(evaluables), campos=', '.join(columnas)):
+                resultado = (
+                    self.extractor_file.loader.scan(self.extractor_file, self.token)
+                    .select(["LINE_NUMBER"] + columnas)
+                    .with_columns([reglas[i][3].fill_null(False).alias(f"__regla_{i}") for i in evaluables])
+                    .filter(pl.any_horizontal(flags))
+                    .collect()
+                )
+            # polars no se puede interrumpir a mitad de collect: se comprueba al terminar
+            self.token.check()
+            for i in evaluables:
+                fallos = resultado.filter(pl.col(f"__regla_{i}")).select(["LINE_NUMBER", reglas[i][0]])
+                hallazgos[i] = fallos.rows()
+        return self._volcar_errores(reglas, hallazgos)
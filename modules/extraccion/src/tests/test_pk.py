@@ -1,27 +1,42 @@
 import os
 import pandas as pd
+import polars as pl
 from collections import defaultdict
 from modules.extraccion.src.tests.test_base import TestExtractor, EmptyConfig, EmptyFile, ExtractorFile
 from PySide6.QtCore import QThread
+from modules.extraccion.src.File import UnsupportedEncoding
+from modules.extraccion.src.sqlite_pool import SQLitePool
 
 class TestPK(TestExtractor):
     name = 'PK'
+    SPILL_BYTES = 1024 * 1024 * 1024  # A partir de este tamaño la ordenación de claves va a disco
 
     def __init__(self, extractor_file):
         super().__init__(extractor_file)
         self._abort = False  # Flag para abortar
+        self.file_size = 0
 
     def run(self):
         # Elimina el sleep, solo aborta si se solicita
         if getattr(self, "_abort", False):
             self.launch_warning("Test abortado por el usuario.")
             return
-        file_size = os.path.getsize(self.extractor_file.find_file(
+        self.file_size = os.path.getsize(self.extractor_file.find_file(
             self.extractor_file.file_path,
             self.extractor_file.file,
             self.extractor_file.config_content['metadata']['Extension']
         ))
-        validaciones = self.validar_pk_sqlite()
+        with self.profiler.span("validacion_pk") as span:
+            validaciones = None
+            if self.usar_polars():
+                try:
+                    validaciones = self.validar_pk_polars()
+                    span.args["motor"] = "polars"
+                except UnsupportedEncoding as e:
+                    self.log += f"Motor polars no disponible ({e}), se valida con SQLite\n"
+            if validaciones is None:
+                validaciones = self.validar_pk_sqlite()
+                span.args["motor"] = "sqlite"
         if len(validaciones) == 0:
             self.launch_ok('Todo OK!')
         else:
@@ -31,8 +46,15 @@ class TestPK(TestExtractor):
 
     def abort(self):
         self._abort = True
+        self.token.cancel()
 
     def validar_pk_sqlite(self):
+        """
+        Una sola pasada: COUNT(*) OVER (PARTITION BY pk) marca las claves repetidas y el mismo
+        recorrido detecta las PK sin informar. Con ficheros de más de SPILL_BYTES sin índice de PK
+        la ordenación de SQLite se hace en ficheros temporales para acotar la memoria con claves
+        de alta cardinalidad.
+        """
         estructura = self.extractor_file.config_content['structure']
         detalles = defaultdict(lambda: defaultdict(list))
         columnas_pk = [campo['name'].upper() for campo in estructura if campo.get('pk')]
@@ -40,50 +62,83 @@ class TestPK(TestExtractor):
         if not columnas_pk:
             return detalles  # No hay PK definida
 
-        self.extractor_file.loader._ensure_db_polars(self.extractor_file)
+        self.extractor_file.loader._ensure_db_polars(self.extractor_file, self.token)
         db_path = self.extractor_file.loader._db_path
-        import sqlite3
-        conn = sqlite3.connect(db_path)
+        # Con el índice de PK la partición se recorre en orden de índice y no hace falta ordenar
+        spill = self.file_size > self.SPILL_BYTES and not self.extractor_file.loader.has_index(columnas_pk)
         table_name = "data"
         pk_cols = ','.join([f'"{col}"' for col in columnas_pk])
-
         # PK sin informar: alguna columna PK vacía o nula
-        for col in columnas_pk:
-            query = f'''
-                SELECT LINE_NUMBER, "{col}"
-                FROM {table_name}
-                WHERE "{col}" IS NULL OR TRIM("{col}") = ''
-            '''
-            for row in conn.execute(query):
-                detalles[col]["PK sin informar"].append((row[0], row[1]))
-
-        # PK duplicada: filas con mismos valores en todas las columnas PK (incluyendo nulos/vacíos)
+        sin_informar = ' OR '.join(f'"{col}" IS NULL OR TRIM("{col}") = \'\'' for col in columnas_pk)
         query = f'''
-            SELECT {pk_cols}, COUNT(*)
-            FROM {table_name}
-            GROUP BY {pk_cols}
-            HAVING COUNT(*) > 1
+            SELECT LINE_NUMBER, {pk_cols}, repeticiones
+            FROM (
+                SELECT LINE_NUMBER, {pk_cols}, COUNT(*) OVER (PARTITION BY {pk_cols}) AS repeticiones
+                FROM {table_name}
+            )
+            WHERE repeticiones > 1 OR {sin_informar}
+            ORDER BY {pk_cols}, LINE_NUMBER
         '''
-        cursor = conn.execute(query)
-        for row in cursor:
-            pk_values = {col: row[i] for i, col in enumerate(columnas_pk)}
-            count = row[len(columnas_pk)]
-            # Busca las líneas que tienen esos valores
-            where_pk = ' AND '.join([
-                f'("{col}" IS ? OR "{col}" = ?)' if pk_values[col] == '' else f'"{col}" = ?'
-                for col in columnas_pk
-            ])
-            params = []
+        vacias = defaultdict(list)
+        with SQLitePool.connection(db_path) as conn, self.token.watch(conn):
+            if spill:
+                conn.execute("PRAGMA temp_store = FILE")
+            total_filas = conn.execute("SELECT MAX(LINE_NUMBER) FROM data").fetchone()[0] or 0
+            try:
+                with self.profiler.span("pk_agrupacion", rows=total_filas, columnas=pk_cols, spill=spill):
+                    for row in conn.execute(query):
+                        if getattr(self, "_abort", False):
+                            print("Abortando validación de PK")
+                            break
+                        line_number = row[0]
+                        valores = row[1:-1]
+                        for col, valor in zip(columnas_pk, valores):
+                            if valor is None or valor.strip(' ') == '':
+                                vacias[col].append((line_number, valor))
+                        # PK duplicada: filas con mismos valores en todas las columnas PK (incluyendo vacíos)
+                        if row[-1] > 1:
+                            clave = ', '.join(f'{col}={valor}' for col, valor in zip(columnas_pk, valores))
+                            detalles["__PK__"]["Duplicada"].append((line_number, f"PK duplicada: {clave}"))
+            finally:
+                if spill:
+                    conn.execute("PRAGMA temp_store = MEMORY")
+        # Los resultados llegan ordenados por clave; las PK sin informar se listan por línea
+        resultado = defaultdict(lambda: defaultdict(list))
+        for col in columnas_pk:
+            if vacias[col]:
+                resultado[col]["PK sin informar"] = sorted(vacias[col])
+        if detalles["__PK__"]["Duplicada"]:
+            resultado["__PK__"]["Duplicada"] = detalles["__PK__"]["Duplicada"]
+        return resultado
+
+    def validar_pk_polars(self):
+        """Equivalente a validar_pk_sqlite con polars, sobre la caché columnar o el fichero fuente."""
+        estructura = self.extractor_file.config_content['structure']
+        detalles = defaultdict(lambda: defaultdict(list))
+        columnas_pk = [campo['name'].upper() for campo in estructura if campo.get('pk')]
+
+        if not columnas_pk:
+            return detalles  # No hay PK definida
+
+        datos = self.extractor_file.loader.scan(self.extractor_file, self.token).select(["LINE_NUMBER"] + columnas_pk)
+
+        # PK sin informar: TRIM de SQLite solo quita espacios
+        with self.profiler.span("pk_sin_informar", columnas=', '.join(columnas_pk)):
             for col in columnas_pk:
-                val = pk_values[col]
-                if val == '':
-                    params.extend([None, ''])
-                else:
-                    params.append(val)
-            subquery = f'SELECT LINE_NUMBER FROM {table_name} WHERE {where_pk}'
-            for line_row in conn.execute(subquery, params):
-                clave = ', '.join(f'{col}={pk_values[col]}' for col in columnas_pk)
-                msg = f"PK duplicada: {clave}"
-                detalles["__PK__"]["Duplicada"].append((line_row[0], msg))
-        conn.close()
+                vacias = datos.filter(pl.col(col).is_null() | (pl.col(col).str.strip_chars(' ') == ''))
+                vacias = vacias.select(["LINE_NUMBER", col]).collect().rows()
+                self.token.check()
+                if vacias:
+                    detalles[col]["PK sin informar"].extend(vacias)
+
+        # PK duplicada, agrupada por clave y en orden de línea dentro de cada clave
+        with self.profiler.span("pk_agrupacion", columnas=', '.join(columnas_pk)):
+            duplicadas = (
+                datos.filter(pl.col("LINE_NUMBER").count().over(columnas_pk) > 1)
+                .sort(columnas_pk + ["LINE_NUMBER"])
+                .collect()
+            )
+        for row in duplicadas.iter_rows():
+            clave = ', '.join(f'{col}={row[i + 1]}' for i, col in enumerate(columnas_pk))
+            detalles["__PK__"]["Duplicada"].append((row[0], f"PK duplicada: {clave}"))
         return detalles
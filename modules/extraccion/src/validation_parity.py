@@ -0,0 +1,88 @@
+"""
+Comprobación de paridad entre los motores de validación SQLite y polars.
+
+Genera un extracto con casos límite, ejecuta TestFormato y TestPK con cada motor (y con cada
+backend de caché) y compara los diccionarios de errores. Sale con código 1 si alguno difiere.
+
+    python -m modules.extraccion.src.validation_parity
+"""
+import sys
+import tempfile
+
+from modules.extraccion.src.File import ExtractorFile
+from modules.extraccion.src.tests.test_formato import TestFormato
+from modules.extraccion.src.tests.test_pk import TestPK
+
+# Valores límite que se prueban en todas las columnas validadas
+CASOS = [
+    '', ' ', '-', '--1', '+1', '0', '-0', '00012', '123', '1234', '-123', '12-3', '1e5', ' 1', '1 ',
+    '1.', '.1', '-.1', '1.5', '-1.5', '123.45', '1234.5', '123.456', '1..2', '1.2.3', '999999',
+    'abc', 'ñ', 'ñññ', 'ññññ', '😀😀😀', '😀😀😀😀', '١٢٣', '0x1F', 'NULL', 'None', 'nan',
+    '2024-02-29', '2025-02-29', '2025-02-30', '2024-04-31', '2024-13-01', '2024-00-10', '2024-1-1',
+    '20240101', '2024/01/01', '0001-01-01', '9999-12-31', '2024-01-01 ',
+]
+
+# Claves PK con huecos, espacios y duplicados
+CLAVES = ['A', 'B', 'A', '', ' ', 'C', '', 'b', 'B', 'a ']
+
+ESTRUCTURA = [
+    {'name': 'TEXTO', 'type': 'VARCHAR', 'size': 3},
+    {'name': 'TEXTO_LIBRE', 'type': 'VARCHAR'},
+    {'name': 'ENTERO', 'type': 'INTEGER', 'size': 3},
+    {'name': 'ENTERO_LIBRE', 'type': 'INTEGER'},
+    {'name': 'IMPORTE', 'type': 'DECIMAL', 'size': 5, 'precision': 2},
+    {'name': 'IMPORTE_SIN_PRECISION', 'type': 'DECIMAL', 'size': 5, 'precision': None},
+    {'name': 'FECHA', 'type': 'DATE', 'size': 10},
+    {'name': 'FECHA_EUROPEA', 'type': 'DATE', 'size': 10, 'format': '%d/%m/%Y'},
+    {'name': 'CLAVE', 'type': 'VARCHAR', 'size': 2, 'pk': 'Y'},
+    {'name': 'SUBCLAVE', 'type': 'INTEGER', 'size': 2, 'pk': 'Y'},
+]
+
+METADATA = {'Separator': '|', 'Extension': 'csv', 'Encoding': 'UTF-8', 'Header': False}
+
+
+def escribir_corpus(carpeta):
+    lineas = []
+    for i, valor in enumerate(CASOS):
+        clave = CLAVES[i % len(CLAVES)]
+        subclave = str(i % 3)
+        fecha_europea = '/'.join(reversed(valor.split('-'))) if valor.count('-') == 2 else valor
+        lineas.append('|'.join([valor] * 7 + [fecha_europea, clave, subclave]))
+    with open(f"{carpeta}/PARIDAD.csv", 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lineas) + '\n')
+
+
+def ejecutar(carpeta, cache, motor):
+    metadata = dict(METADATA, Cache=cache)
+    extractor_file = ExtractorFile('PARIDAD', '1', 'PARIDAD', carpeta,
+                                   config_content={'metadata': metadata, 'structure': ESTRUCTURA})
+    resultados = {}
+    for test_class in (TestFormato, TestPK):
+        test = test_class(extractor_file)
+        test.validation_backend = motor
+        test.run()
+        resultados[test_class.name] = (test.status, test.convertir_a_dict(test.errors))
+    return resultados
+
+
+def main():
+    with tempfile.TemporaryDirectory() as carpeta:
+        escribir_corpus(carpeta)
+        referencia = ejecutar(carpeta, 'sqlite', 'sqlite')
+        fallos = 0
+        for cache, motor in [('sqlite', 'polars'), ('arrow', 'polars'), ('arrow', 'sqlite')]:
+            resultado = ejecutar(carpeta, cache, motor)
+            for test_name, esperado in referencia.items():
+                obtenido = resultado[test_name]
+                if obtenido != esperado:
+                    fallos += 1
+                    print(f"❌ {test_name} difiere con caché {cache} y motor {motor}")
+                    print(f"   sqlite: {esperado}")
+                    print(f"   {motor}: {obtenido}")
+                else:
+                    print(f"✔️ {test_name} coincide con caché {cache} y motor {motor}")
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,398 @@
+import collections
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager, nullcontext
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from modules.extraccion.src.sqlite_pool import SQLitePool
+
+
+def _read(conn, sql, params):
+    # Sin pd.read_sql_query: envuelve los errores de SQLite y token.watch no reconocería la interrupción
+    cursor = conn.execute(sql, params)
+    return pd.DataFrame(cursor.fetchall(), columns=[col[0] for col in cursor.description])
+
+
+def _watch(token, conn):
+    # Con token, cancelarlo interrumpe la consulta en curso (Connection.interrupt) y lanza Cancelled
+    return token.watch(conn) if token is not None else nullcontext(conn)
+
+
+def display_text(value):
+    """Texto de una celda tal como la muestra el visor; NULL (None, o NaN tras pasar por pandas) queda vacío."""
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    return str(value)
+
+
+def as_text(df):
+    # astype(str) deja los NULL como NaN en pandas 3: se convierte celda a celda
+    return df.map(display_text)
+
+
+# Cadenas entre comillas simples o dobles: su contenido no se toca al normalizar
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+
+def normalize_sql(sql):
+    """Quita espacios sobrantes y el ';' final fuera de las cadenas, para reconocer la misma consulta."""
+    partes = _QUOTED.split(sql or "")
+    for i in range(0, len(partes), 2):
+        partes[i] = " ".join(partes[i].split())
+    return "".join(partes).strip().rstrip(";").strip()
+
+
+def cache_db_key(db_path):
+    """Identifica una versión concreta de la caché: si se reconstruye cambian mtime y tamaño."""
+    stat = Path(db_path).stat()
+    return str(Path(db_path).resolve()), stat.st_mtime_ns, stat.st_size
+
+
+def _to_ipc(table):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class QueryResultStore:
+    """
+    Páginas y recuentos de las consultas del visor guardados junto a la caché, en
+    .sqlite_cache/viewer_queries.sqlite, para que repetir una consulta en otra sesión tampoco
+    vuelva a la tabla data. Las páginas van en formato Arrow IPC y, si se pasa de max_bytes,
+    se borran las usadas hace más tiempo. Es solo un atajo: si falla, se consulta sin él.
+    """
+    DB_NAME = "viewer_queries.sqlite"
+    max_bytes = 500 * 1024 * 1024  # 500 MB por carpeta de caché
+    _stores = {}  # carpeta de la caché -> QueryResultStore
+    _stores_lock = threading.Lock()
+
+    def __init__(self, cache_dir):
+        self.db_path = os.path.join(cache_dir, self.DB_NAME)
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            # En WAL los BlockLoader leen páginas mientras otro guarda la suya
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    db TEXT, mtime INTEGER, size INTEGER, sql TEXT, page_size INTEGER, page INTEGER,
+                    data BLOB, bytes INTEGER, used REAL,
+                    PRIMARY KEY (db, mtime, size, sql, page_size, page)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS counts (
+                    db TEXT, mtime INTEGER, size INTEGER, sql TEXT, total INTEGER,
+                    PRIMARY KEY (db, mtime, size, sql)
+                )
+            """)
+
+    @classmethod
+    def for_db(cls, db_path):
+        """Almacén de la carpeta de la caché db_path, o None si no se puede abrir."""
+        cache_dir = os.path.dirname(db_path)
+        with cls._stores_lock:
+            if cache_dir not in cls._stores:
+                try:
+                    cls._stores[cache_dir] = cls(cache_dir)
+                except sqlite3.Error:
+                    cls._stores[cache_dir] = None
+            return cls._stores[cache_dir]
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.db_path, timeout=1))
+
+    def get_page(self, key):
+        (db, mtime, size), sql, page_size, page = key
+        try:
+            with self._connect() as conn, conn:
+                row = conn.execute(
+                    "SELECT data FROM pages WHERE db = ? AND mtime = ? AND size = ? AND sql = ? "
+                    "AND page_size = ? AND page = ?", (db, mtime, size, sql, page_size, page)).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE pages SET used = ? WHERE db = ? AND mtime = ? AND size = ? AND sql = ? "
+                    "AND page_size = ? AND page = ?", (time.time(), db, mtime, size, sql, page_size, page))
+        except sqlite3.Error:
+            return None
+        return pa.ipc.open_stream(row[0]).read_all()
+
+    def set_page(self, key, table):
+        (db, mtime, size), sql, page_size, page = key
+        data = _to_ipc(table)
+        try:
+            with self._connect() as conn, conn:
+                # Lo guardado de versiones anteriores de la caché ya no se volverá a pedir
+                conn.execute("DELETE FROM pages WHERE db = ? AND (mtime != ? OR size != ?)", (db, mtime, size))
+                conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (db, mtime, size, sql, page_size, page, data, len(data), time.time()))
+                conn.execute("""
+                    DELETE FROM pages WHERE rowid IN (
+                        SELECT rowid FROM (SELECT rowid, SUM(bytes) OVER (ORDER BY used DESC) AS acumulado FROM pages)
+                        WHERE acumulado > ?)
+                """, (self.max_bytes,))
+        except sqlite3.Error:
+            pass
+
+    def get_count(self, key):
+        (db, mtime, size), sql = key
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT total FROM counts WHERE db = ? AND mtime = ? AND size = ? AND sql = ?",
+                                   (db, mtime, size, sql)).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def set_count(self, key, total):
+        (db, mtime, size), sql = key
+        try:
+            with self._connect() as conn, conn:
+                conn.execute("DELETE FROM counts WHERE db = ? AND (mtime != ? OR size != ?)", (db, mtime, size))
+                conn.execute("INSERT OR REPLACE INTO counts VALUES (?, ?, ?, ?, ?)", (db, mtime, size, sql, total))
+                # Un recuento sin ninguna página guardada ya no ahorra nada
+                conn.execute("""
+                    DELETE FROM counts WHERE NOT EXISTS (
+                        SELECT 1 FROM pages p WHERE p.db = counts.db AND p.mtime = counts.mtime
+                        AND p.size = counts.size AND p.sql = counts.sql)
+                    AND NOT (db = ? AND mtime = ? AND size = ? AND sql = ?)
+                """, (db, mtime, size, sql))
+        except sqlite3.Error:
+            pass
+
+
+class QueryResultCache:
+    """
+    Caché LRU de páginas de resultados de consultas del visor, por (versión de la caché,
+    SQL normalizada, tamaño de página, página). Guarda las páginas como tablas Arrow de textos,
+    tal como se muestran, y limita el total de bytes igual que FileContentCache. Por debajo
+    está QueryResultStore, que las conserva entre sesiones. Los recuentos se guardan igual,
+    con un LRU de max_counts entradas.
+    """
+    _cache = collections.OrderedDict()
+    _max_bytes = 100 * 1024 * 1024  # 100 MB
+    _counts = collections.OrderedDict()  # (versión de la caché, SQL normalizada) -> filas del resultado
+    max_counts = 1000
+    _lock = threading.RLock()
+
+    @classmethod
+    def get(cls, key):
+        with cls._lock:
+            if key in cls._cache:
+                cls._cache.move_to_end(key)
+                return cls._cache[key][0].to_pandas()
+        store = QueryResultStore.for_db(key[0][0])
+        table = store.get_page(key) if store is not None else None
+        if table is None:
+            return None
+        cls._put(key, table)
+        return table.to_pandas()
+
+    @classmethod
+    def set(cls, key, df):
+        table = pa.Table.from_pandas(as_text(df), preserve_index=False)
+        cls._put(key, table)
+        store = QueryResultStore.for_db(key[0][0])
+        if store is not None:
+            store.set_page(key, table)
+
+    @classmethod
+    def _put(cls, key, table):
+        with cls._lock:
+            cls._cache[key] = (table, table.nbytes)
+            cls._cache.move_to_end(key)
+            cls._evict_if_needed()
+
+    @classmethod
+    def get_count(cls, key):
+        with cls._lock:
+            if key in cls._counts:
+                cls._counts.move_to_end(key)
+                return cls._counts[key]
+        store = QueryResultStore.for_db(key[0][0])
+        total = store.get_count(key) if store is not None else None
+        if total is not None:
+            cls._put_count(key, total)
+        return total
+
+    @classmethod
+    def set_count(cls, key, total):
+        cls._put_count(key, total)
+        store = QueryResultStore.for_db(key[0][0])
+        if store is not None:
+            store.set_count(key, total)
+
+    @classmethod
+    def _put_count(cls, key, total):
+        with cls._lock:
+            cls._counts[key] = total
+            cls._counts.move_to_end(key)
+            while len(cls._counts) > cls.max_counts:
+                cls._counts.popitem(last=False)
+
+    @classmethod
+    def remove(cls, key):
+        with cls._lock:
+            cls._cache.pop(key, None)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._cache.clear()
+            cls._counts.clear()
+
+    @classmethod
+    def _evict_if_needed(cls):
+        while cls._total_bytes() > cls._max_bytes and len(cls._cache) > 1:
+            cls._cache.popitem(last=False)
+
+    @classmethod
+    def _total_bytes(cls):
+        return sum(size for _, size in cls._cache.values())
+
+
+class QueryPager:
+    """
+    Páginas de una consulta del visor en tiempo constante. Sin consulta se pagina la tabla data
+    por LINE_NUMBER, que es denso desde 1. Una consulta del usuario se materializa una vez en una
+    tabla temporal, cuyo rowid también es denso, así que la página n empieza siempre en la clave
+    n * page_size y no hay que recorrer las anteriores como con OFFSET. Las páginas de las
+    consultas y sus recuentos se guardan en QueryResultCache: repetir una consulta, también en
+    otra sesión, no vuelve a la tabla data.
+    """
+
+    def __init__(self, extractor_file, sql_query, page_size):
+        self.extractor_file = extractor_file
+        self.sql_query = normalize_sql(sql_query)
+        self.page_size = page_size
+        self.db_path = None
+        self.count = None
+        self.materialized = False
+        self._conn = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _ensure_db(self, token=None):
+        if self.db_path is None:
+            self.extractor_file.loader._ensure_db_polars(self.extractor_file, token)
+            self.db_path = self.extractor_file.loader._db_path
+        return self.db_path
+
+    def _count_key(self):
+        return cache_db_key(self._ensure_db()), self.sql_query
+
+    def cached_count(self):
+        """
+        Número de filas que se conoce sin recorrer el resultado: el de la tabla entera sale del
+        máximo LINE_NUMBER y el de una consulta, de una ejecución anterior. None si no se sabe.
+        """
+        if self.count is not None:
+            return self.count
+        if not self.sql_query:
+            with SQLitePool.connection(self._ensure_db()) as conn:
+                self.count = conn.execute('SELECT COALESCE(MAX("LINE_NUMBER"), 0) FROM data').fetchone()[0]
+            return self.count
+        self.count = QueryResultCache.get_count(self._count_key())
+        return self.count
+
+    def exact_count(self, token=None):
+        """Materializa la consulta si hace falta y devuelve su número exacto de filas."""
+        self._ensure_db(token)
+        if self.cached_count() is not None:
+            return self.count
+        self.materialize(token)
+        with self._using_conn() as conn:
+            self.count = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM temp.resultado").fetchone()[0]
+        QueryResultCache.set_count(self._count_key(), self.count)
+        return self.count
+
+    def lower_bound(self, page, page_rows):
+        """Filas que seguro tiene el resultado tras ver page_rows filas en la página page."""
+        return page * self.page_size + page_rows
+
+    def materialize(self, token=None):
+        if self.materialized or not self.sql_query:
+            return
+        with self._using_conn() as conn, _watch(token, conn):
+            if self.materialized:
+                return  # Otro hilo la materializó mientras se esperaba la conexión
+            conn.execute("DROP TABLE IF EXISTS temp.resultado")
+            conn.execute(f"CREATE TEMP TABLE resultado AS SELECT * FROM ({self.sql_query})")
+            self.materialized = True
+
+    @contextmanager
+    def _using_conn(self):
+        """
+        Presta la conexión propia del pager, que guarda la tabla temporal. Si se cierra el pager
+        mientras está prestada, la cierra quien la tenga al devolverla.
+        """
+        db_path = self._ensure_db()
+        with self._lock:
+            if self._closed:
+                raise sqlite3.OperationalError("interrupted")
+            if self._conn is None:
+                uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+                self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                self._conn.execute(f"PRAGMA mmap_size = {SQLitePool.mmap_size}")
+                # La tabla temporal va a disco: un resultado de millones de filas no debe ocupar RAM
+                self._conn.execute("PRAGMA temp_store = FILE")
+            try:
+                yield self._conn
+            finally:
+                if self._closed:
+                    self._release_conn()
+
+    def _release_conn(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self.materialized = False
+
+    def fetch_page(self, page, token=None):
+        """DataFrame con las filas de la página (0 = primera)."""
+        if not self.sql_query:
+            return self._fetch_page(page, token)
+        key = (cache_db_key(self._ensure_db(token)), self.sql_query, self.page_size, page)
+        df = QueryResultCache.get(key)
+        if df is None:
+            df = self._fetch_page(page, token)
+            QueryResultCache.set(key, df)
+        return df
+
+    def _fetch_page(self, page, token):
+        inicio = page * self.page_size
+        if not self.sql_query:
+            with SQLitePool.connection(self._ensure_db(token)) as conn, _watch(token, conn):
+                return _read(conn, 'SELECT * FROM data WHERE "LINE_NUMBER" > ? ORDER BY "LINE_NUMBER" LIMIT ?',
+                             (inicio, self.page_size))
+        if self.materialized:
+            with self._using_conn() as conn, _watch(token, conn):
+                return _read(conn, "SELECT * FROM temp.resultado WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                             (inicio, self.page_size))
+        if page > 0 and self.cached_count() is not None:
+            # Un OFFSET recorrería de nuevo la consulta por cada página: se materializa una vez. Sin
+            # total conocido el recuento ya la está materializando y mientras tanto se usa OFFSET
+            self.materialize(token)
+            return self._fetch_page(page, token)
+        # La primera página sale de la consulta tal cual, sin esperar a materializarla
+        with SQLitePool.connection(self._ensure_db(token)) as conn, _watch(token, conn):
+            return _read(conn, f"SELECT * FROM ({self.sql_query}) LIMIT ? OFFSET ?", (self.page_size, inicio))
+
+    def close(self):
+        """Interrumpe una materialización en curso y libera la tabla temporal."""
+        self._closed = True
+        conn = self._conn
+        if conn is not None:
+            conn.interrupt()
+        # No espera a quien esté usando la conexión: ese hilo la cierra al devolverla
+        if self._lock.acquire(blocking=False):
+            try:
+                self._release_conn()
+            finally:
+                self._lock.release()
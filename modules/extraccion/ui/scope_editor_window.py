@@ -667,6 +667,13 @@ class ScopeEditorWindow(CardFrame):
         meta_layout.addWidget(nulable_chk, 2, 1)
         self.meta_fields["Nulable"] = nulable_chk
 
+        cache_edit = LabeledComboBox(
+            label="Caché:",
+            items=['sqlite', 'arrow']
+        )
+        meta_layout.addWidget(cache_edit, 3, 0)
+        self.meta_fields["Cache"] = cache_edit
+
         meta_layout.addItem(QSpacerItem(0, 30, QSizePolicy.Minimum, QSizePolicy.Expanding))
 
         # Hacer scrolleable
@@ -785,6 +792,8 @@ class ScopeEditorWindow(CardFrame):
                 widget.checkbox.setChecked(False)
             elif isinstance(widget, QCheckBox):
                 widget.setChecked(False)
+            elif isinstance(widget, LabeledComboBox):
+                widget.combobox.setCurrentIndex(0)
         for key, widget in self.ddr_fields.items():
             if key == "excel_columns":
                 widget.clear()
@@ -809,6 +818,11 @@ class ScopeEditorWindow(CardFrame):
                     widget.checkbox.setChecked(bool(meta[key]))
                 elif isinstance(widget, QCheckBox):
                     widget.setChecked(bool(meta[key]))
+                elif isinstance(widget, LabeledComboBox):
+                    # Un valor que no está en la lista (p. ej. otro encoding) se añade para no perderlo al guardar
+                    if widget.combobox.findText(str(meta[key])) < 0:
+                        widget.combobox.addItem(str(meta[key]))
+                    widget.combobox.setCurrentText(str(meta[key]))
             else:
                 if isinstance(widget, QLineEdit):
                     widget.setText("")
@@ -816,6 +830,9 @@ class ScopeEditorWindow(CardFrame):
                     widget.checkbox.setChecked(False)
                 elif isinstance(widget, QCheckBox):
                     widget.setChecked(False)
+                elif isinstance(widget, LabeledComboBox):
+                    # Sin la clave vale el primer elemento: 'sqlite' en Cache, que es también el valor por defecto
+                    widget.combobox.setCurrentIndex(0)
         # ddr.yaml
         ddr = scope.ddr
         for key, widget in self.ddr_fields.items():
@@ -842,6 +859,8 @@ class ScopeEditorWindow(CardFrame):
                 meta_dict[key] = widget.checkbox.isChecked()
             elif isinstance(widget, QCheckBox):
                 meta_dict[key] = widget.isChecked()
+            elif isinstance(widget, LabeledComboBox):
+                meta_dict[key] = widget.combobox.currentText()
         # ddr.yaml
         ddr_dict = {}
         # Excel columns
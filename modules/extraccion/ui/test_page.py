@@ -19,6 +19,10 @@ from widgets.results_table_widget import ResultsTableWidget, TestTableModel
 from modules.extraccion.src.FileViewer import FileViewerWidget
 from modules.extraccion.ui.error_page import ErrorViewerDialog
 from modules.extraccion.src.test_controller import TestController
+from modules.extraccion.src.sqlite_pool import SQLitePool
+from modules.extraccion.src.tests.test_base import VALIDATION_BACKENDS
+from modules.extraccion.src.test_worker import EXECUTION_BACKENDS
+from modules.extraccion.src.profiling import export_chrome_trace
 
 MODULE_BASE = os.path.dirname(os.path.dirname(__file__))
 
@@ -63,6 +67,17 @@ class TestFormPage(QWidget):
         self.input_folder_lineedit.lineedit.setEnabled(False)
         self.folder_form_layout.addWidget(self.input_folder_lineedit)
 
+        self.backend_combo = LabeledComboBox("Motor de validación:", items=list(VALIDATION_BACKENDS))
+        self.folder_form_layout.addWidget(self.backend_combo)
+
+        self.workers_combo = LabeledComboBox("Tests en paralelo:",
+                                             items=[str(n) for n in range(1, controller.max_workers + 1)])
+        self.workers_combo.combobox.setCurrentText(str(controller.max_workers))
+        self.folder_form_layout.addWidget(self.workers_combo)
+
+        self.execution_combo = LabeledComboBox("Ejecución:", items=list(EXECUTION_BACKENDS))
+        self.folder_form_layout.addWidget(self.execution_combo)
+
         self.layout.addStretch()
 
         self.next_button = PrimaryButton("Siguiente")
@@ -190,15 +205,18 @@ class TestResultsPage(QWidget):
         self.restart_button.clicked.connect(self.restart_tests)
         self.controller.test_status_changed.connect(self.update_cell)
         self.controller.test_progress.connect(self.set_progress)
+        self.controller.ingest_progress.connect(self.set_ingest_progress)
         self.controller.tests_finished.connect(self.set_buttons_on_finish)
 
-    def build_pending_matrix(self):
+    def build_pending_matrix(self, restore=True):
         self.progress_bar.setValue(0)
         self.progress_bar.setEnabled(False)
+        self.progress_bar.resetFormat()
         scope_name = self.form_page.scope_combo.currentText()
         version_name = self.form_page.version_combo.currentText()
-        files, test_objects = self.controller.build_pending_matrix(scope_name, version_name, self.form_page.input_folder)
-        self.model = TestTableModel(files, test_objects, self.controller.test_classes)
+        files, test_objects = self.controller.build_pending_matrix(scope_name, version_name, self.form_page.input_folder,
+                                                                   restore=restore)
+        self.model = TestTableModel(files, test_objects, self.controller.test_classes, self.controller.ingest_objects)
         self.set_model(self.model, self.filter_proxy_model)
         # Asegura que el menú contextual funcione tras cambiar el modelo
         self.results_table.table.setContextMenuPolicy(Qt.CustomContextMenu)
@@ -248,33 +266,50 @@ class TestResultsPage(QWidget):
     def show_log_dialog(self, index):
         row = index.row()
         col = index.column()
-        if col == 0:
-            return
         try:
-            test = self.controller.test_objects[row][col - 1]
+            if col == 0:
+                test = self.controller.ingest_objects[row]
+            else:
+                test = self.controller.test_objects[row][col - 1]
         except IndexError:
             return
         log_text = getattr(test, "log", "(Sin log)")
+        profiler = getattr(test, "profiler", None)
+        if profiler is not None and profiler.spans:
+            log_text = f"{log_text}\n── Perfil ──\n{profiler.summary()}"
         dialog = QDialog(self)
-        dialog.setWindowTitle(f"Log - {self.model.test_names[col - 1]}")
+        dialog.setWindowTitle(f"Log - {test.name}")
         layout = QVBoxLayout(dialog)
         text_edit = QTextEdit()
         text_edit.setReadOnly(True)
         text_edit.setPlainText(log_text)
         layout.addWidget(text_edit)
+        if profiler is not None and profiler.spans:
+            trace_btn = QPushButton("Exportar traza (Chrome)")
+            trace_btn.clicked.connect(lambda: self.export_trace([profiler]))
+            layout.addWidget(trace_btn)
         close_btn = QPushButton("Cerrar")
         close_btn.clicked.connect(dialog.accept)
         layout.addWidget(close_btn)
         dialog.resize(500, 400)
         dialog.exec()
 
+    def export_trace(self, profilers):
+        path, _ = QFileDialog.getSaveFileName(self, "Exportar traza", "traza.json", "Chrome trace (*.json)")
+        if path:
+            export_chrome_trace(profilers, path)
+
     def run_tests(self):
         self.set_buttons_on_run()
+        self.controller.validation_backend = self.form_page.backend_combo.currentText()
+        self.controller.max_workers = int(self.form_page.workers_combo.currentText())
+        self.controller.execution_backend = self.form_page.execution_combo.currentText()
         self.controller.start_tests()
 
     def restart_tests(self):
         self.set_buttons_on_restart()
-        self.build_pending_matrix()
+        # Reiniciar descarta los resultados guardados y vuelve a ejecutar todo
+        self.build_pending_matrix(restore=False)
 
     def update_cell(self, row, col, status):
         self.model.update_test_status(row, col, status)
@@ -302,6 +337,9 @@ class TestResultsPage(QWidget):
         self.progress_bar.setMaximum(total)
         self.progress_bar.setValue(executed)
 
+    def set_ingest_progress(self, executed, total):
+        self.progress_bar.setFormat(f"Ingesta {executed}/{total}  ·  Tests %v/%m")
+
     def set_buttons_on_run(self):
         self.pause_button.setEnabled(True)
         self.abort_button.setEnabled(True)
@@ -366,9 +404,11 @@ class TestPage(CardStacked):
                 for test in row_tests:
                     if hasattr(test, "abort"):
                         test.abort()
+            self.controller.shutdown_process_pool()
             if hasattr(self.controller, "thread_pool"):
                 self.controller.thread_pool.clear()
                 self.controller.thread_pool.waitForDone(1000)
+        SQLitePool.close_all()
         print("Tareas de fondo cerradas correctamente.")
 
     def show_file_viewer(self, extractor_file):
@@ -101,12 +101,13 @@ class ResultsTableWidget(QWidget):
         return self.table.viewport()
 
 class TestTableModel(QAbstractTableModel):
-    def __init__(self, files, tests, test_classes, parent=None):
+    def __init__(self, files, tests, test_classes, ingests=None, parent=None):
         super().__init__(parent)
         self.files = files
         self.test_classes = test_classes
         self.test_names = [cls.name for cls in self.test_classes]
         self.test_objects = tests
+        self.ingest_objects = ingests or []  # Estado de la ingesta de cada fichero, se muestra en la columna 0
 
     def rowCount(self, parent=QModelIndex()):
         return len(self.files)
@@ -120,6 +121,8 @@ class TestTableModel(QAbstractTableModel):
         row, col = index.row(), index.column()
         if role == Qt.DisplayRole:
             if col == 0:
+                if self.ingest_objects:
+                    return f"{self.files[row]}  ·  {self.ingest_objects[row].status}"
                 return self.files[row]
             else:
                 return self.test_objects[row][col - 1].status
@@ -134,6 +137,9 @@ class TestTableModel(QAbstractTableModel):
         return None
 
     def update_test_status(self, row, col, status):
-        self.test_objects[row][col - 1].status = status
+        if col == 0:
+            self.ingest_objects[row].status = status
+        else:
+            self.test_objects[row][col - 1].status = status
         index = self.index(row, col)
         self.dataChanged.emit(index, index)